@@ -7,9 +7,8 @@ from logging.handlers import RotatingFileHandler
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import time
-import json
 
-from common import log, send_notification
+from common import log, queue_notification
 
 class GamesFileHandler(FileSystemEventHandler):
     def __init__(self, reload_callback):
@@ -20,46 +19,39 @@ class GamesFileHandler(FileSystemEventHandler):
         if event.src_path.endswith(GAMES_FILE):
             self.reload_callback()
 
-def safe_lower(s):
-    return (s or "").lower()
+class ConfigFileHandler(FileSystemEventHandler):
+    def __init__(self, reload_callback):
+        self.reload_callback = reload_callback
+
+    def on_modified(self, event):
+        from settings import CONFIG_FILE
+        if event.src_path.endswith(CONFIG_FILE):
+            self.reload_callback()
 
+# target_patterns is the PatternMatcher built by get_target_patterns
 def is_match(target_patterns, proc):
     try:
-        name = safe_lower(proc.info.get("name"))
-        exe = proc.info.get("exe") or ""
-        exe_base = safe_lower(os.path.basename(exe))
-        exe_full = safe_lower(exe)
+        # Joining every field lets the matcher check them all in one pass. Exe and argument
+        # basenames are substrings of the full values, so they don't need separate checks
         cmdline = proc.info.get("cmdline") or []
-        cmd_lower = [safe_lower(x) for x in cmdline]
-        cmd_bases = [safe_lower(os.path.basename(x)) for x in cmdline]
-
-        for game, patt in target_patterns.items():
-            p = patt.lower()
-            if not p:
-                continue
-            if p in name:
-                return True, game
-            if p in exe_base or p in exe_full:
-                return True, game
-            if any(p in arg for arg in cmd_lower):
-                return True, game
-            if any(p in base for base in cmd_bases):
-                return True, game
+        text = "\0".join([proc.info.get("name") or "", proc.info.get("exe") or "", *cmdline])
+        game = target_patterns.match(text)
+        if game is not None:
+            return True, game
         return False, None
     except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
         return False, None
 
-def get_target_patterns():
+def get_target_patterns(games):
     from common import get_platform
-    from files import get_games_file
     from settings import SKIP_GAMES
+    from process_monitor import PatternMatcher
 
     platform = get_platform()
     if platform == 'unsupported':
         log("Unsupported platform. Aborting", 'error')
-        return {}
+        return PatternMatcher({})
 
-    games = get_games_file()
     target_patterns = {}
     for game, data in games.items():
         if game not in SKIP_GAMES:
@@ -70,118 +62,279 @@ def get_target_patterns():
                 log(f'No process name configured for {game} on {platform}', 'warning')
     
     log(f'Loaded {len(target_patterns)} target patterns for {platform} platform')
-    return target_patterns
+    # Compiled once here and rebuilt whenever the games file reloads
+    return PatternMatcher(target_patterns)
 
-async def get_latest(game):
-    from config import load_cfg
-    from files import get_games_file
-    from common import internet_check
+# snapshot is the registry Snapshot of config and games the caller is working with
+async def get_latest(game, snapshot, remote_state=None):
+    from connectivity import connectivity
     from status import get_status
 
-    config = load_cfg()
-    games = get_games_file()
-    
-    internet_check()
+    config = snapshot.config
+    games = snapshot.games
+
+    # The mirror can be up to REMOTE_POLL_INTERVAL old and may have missed a device with a
+    # slow clock, so the game's row is fetched directly first. If that fails the table is
+    # queried through get_status instead
+    if remote_state is not None and remote_state.ready:
+        try:
+            await asyncio.to_thread(remote_state.refresh_game, game)
+        except Exception as e:
+            log(f'Error while refreshing remote state for {game}, querying directly: {e}', 'warning')
+            connectivity.report_error(e)
+            remote_state = None
+    else:
+        remote_state = None
 
-    try:
-        client = supabase.create_client(config.url, config.api_key)
-    except Exception as e:
-        send_notification(title='Error', message='Failed to create supabase client. Check your supabase url and api key')
-        log(f'Failed to create supabse client: {e}', 'error')
-        return -1
+    if remote_state is not None:
+        client = None
+    else:
+        # Waits without holding a thread if the link is known to be down
+        await connectivity.wait_online()
 
-    
-    data = await asyncio.to_thread(get_status, config=config, client=client, games=games, game_choice=game)
+        try:
+            client = await asyncio.to_thread(supabase.create_client, config.url, config.api_key)
+        except Exception as e:
+            queue_notification(title='Error', message='Failed to create supabase client. Check your supabase url and api key')
+            log(f'Failed to create supabse client: {e}', 'error')
+            return -1
+
+    data = await asyncio.to_thread(get_status, config=config, client=client, games=games, game_choice=game, remote_state=remote_state)
     if data['error']:
-        send_notification(title=game, message=data['error'])
+        queue_notification(title=game, message=data['error'])
         log(f'Error when checking sync status for {game}: {data['error']}', 'error')
         return -1
     
     return data['latest']
 
-def snapshot_matches(target_patterns):
-    matches = {}
-    for proc in psutil.process_iter(["pid", "name", "exe", "cmdline"]):
-        match_found, game = is_match(target_patterns=target_patterns, proc=proc)
-        if match_found:
-            pid = proc.info["pid"]
-            matches[pid] = game
-    return matches
+async def start_game_prefetch(game, prefetches, snapshot):
+    from settings import PREFETCH_CLOUD_SAVES
+    from prefetch import start_prefetch
+
+    if not PREFETCH_CLOUD_SAVES or game in prefetches:
+        return
+    prefetch = await asyncio.to_thread(start_prefetch, config=snapshot.config, games=snapshot.games, entry=game)
+    if prefetch is not None:
+        prefetches[game] = prefetch
+
+# Returns {relative path: md5} of the game's save folder, or None if the folder is invalid
+def get_save_baseline(snapshot, game):
+    from common import get_platform
+    from manifest import snapshot_file_hashes
+    from save_rules import set_save_rules
+
+    path = snapshot.games[game].get(f'{get_platform()}_path')
+    if not path or not os.path.isdir(path):
+        return None
+    set_save_rules(path, snapshot.games[game])
+    return snapshot_file_hashes(path)
+
+# Returns the files changed since the baseline if the cloud still holds exactly the baseline,
+# otherwise None and the whole save has to be uploaded
+def get_upload_delta(snapshot, game, baseline, remote_state):
+    from manifest import combine_file_hashes, changed_files
+
+    if remote_state is None or not remote_state.ready:
+        return None
+    # Only the row as it is now can say the cloud still holds the baseline
+    try:
+        row = remote_state.refresh_game(game)
+    except Exception as e:
+        log(f'Could not fetch the cloud state of {game}, uploading the whole save: {e}', 'warning')
+        return None
+    if row is None or row[snapshot.config.required_columns['hash']] != combine_file_hashes(baseline):
+        return None
+    file_hashes = get_save_baseline(snapshot=snapshot, game=game)
+    return changed_files(baseline, file_hashes) if file_hashes is not None else None
+
+async def on_process_start(state, pid, current, running_games, snapshot, remote_state=None, live_syncs=None, prefetches=None):
+    from connectivity import connectivity
 
-async def on_process_start(state, pid, current, running_games):
     try:
         game = current[pid]
 
-        latest = await get_latest(game=game)
+        # Without a connection the status is checked when the exit sync runs, so the exit
+        # isn't held up waiting for it
+        if connectivity.online is False:
+            latest = 'offline'
+        else:
+            # Hashing the save for the status check also builds the baseline manifest, so at
+            # exit only the files the game wrote are hashed again
+            latest = await get_latest(game=game, snapshot=snapshot, remote_state=remote_state)
         if latest == -1:
             running_games.discard(game)
             return
 
         if latest == 'cloud':
-            send_notification(title=game, message='Cloud save is ahead. Please close the game for the save syncing to begin')
+            queue_notification(title=game, message='Cloud save is ahead. Please close the game for the save syncing to begin')
             log('Cloud save is ahead, waiting for game to close')
+            # Downloading while the game runs so only a swap is left at exit
+            if prefetches is not None:
+                await start_game_prefetch(game=game, prefetches=prefetches, snapshot=snapshot)
         elif latest == 'local':
             log('Local save is ahead, waiting for game to close')
         elif latest == 'synced':
             log(f'{game} save is already in sync')
+        elif latest == 'offline':
+            log(f'Offline, the sync status of {game} will be checked once the connection is back')
         else:
-            send_notification(title='Error', message=f'Unable to determine sync status for {game}')
+            queue_notification(title='Error', message=f'Unable to determine sync status for {game}')
             log(f'Unable to determine sync status for {game}', 'error')
             running_games.discard(game)
             return
         
-        state[pid] = {'game': current[pid], 'latest': latest}
+        # What the save looked like before playing, so the exit sync can upload only what changed
+        baseline = None
+        if latest != 'cloud':
+            baseline = await asyncio.to_thread(get_save_baseline, snapshot=snapshot, game=game)
+        state[pid] = {'game': current[pid], 'latest': latest, 'baseline': baseline}
+
+        # Uploading changes while the game runs is only safe when the cloud isn't ahead
+        from settings import LIVE_SYNC
+        if LIVE_SYNC and live_syncs is not None and latest in ('local', 'synced') and game not in live_syncs:
+            from live_sync import start_live_sync
+
+            live_sync = await asyncio.to_thread(start_live_sync, config=snapshot.config, games=snapshot.games, entry=game)
+            if live_sync is not None:
+                live_syncs[game] = live_sync
     except Exception as e:
         log(f'Unexpected error in on_process_start: {e}', 'error')
         if game:
             running_games.discard(game)
 
 
-async def on_process_exit(info):
-    from config import load_cfg
+# Returns True if the save is synced, False if syncing should be retried
+async def on_process_exit(info, snapshot, remote_state=None, live_sync=None, prefetch=None):
     from supabase_client import upload_save, download_save
-    from files import get_games_file
 
-    # info -> {game: game, latest: latest}
+    # Files the live sync already uploaded don't need uploading again
+    uploaded = await asyncio.to_thread(live_sync.stop) if live_sync is not None else None
+
+    # info -> {game: game, latest: latest, baseline: {relative path: md5} or None}
     await asyncio.sleep(2)
 
     game = info['game']
 
-    # If game was marked as synced when process started, get status again and check if the save updated
-    if info['latest'] == 'synced':
-        latest = await get_latest(game=game)
+    # If game was marked as synced when process started, or it started offline, get status again
+    # and check if the save updated
+    if info['latest'] in ('synced', 'offline'):
+        latest = await get_latest(game=game, snapshot=snapshot, remote_state=remote_state)
         if latest == -1:
-            return
+            return False
         # If game is still synced, return. Otherwise update the status
         if latest == 'synced':
             log(f'{game} save is already in sync')
-            return
+            if prefetch is not None:
+                await asyncio.to_thread(prefetch.discard)
+            return True
         else:
             info['latest'] = latest
     
-    config = load_cfg()
-    games = get_games_file()
+    config = snapshot.config
+    games = snapshot.games
     
-    send_notification(title=game, message='Save syncing started')
+    queue_notification(title=game, message='Save syncing started')
     log(f'Save syncing for {game} started')
 
     if info['latest'] == 'cloud':
-        log(f'Downloading data for {game}...')
-        success = await asyncio.to_thread(download_save, config=config, games=games, entry=game, user_called=False)
+        success = False
+        if prefetch is not None:
+            success = await asyncio.to_thread(prefetch.finish)
+        if not success:
+            log(f'Downloading data for {game}...')
+            success = await asyncio.to_thread(download_save, config=config, games=games, entry=game, user_called=False)
     elif info['latest'] == 'local':
+        if prefetch is not None:
+            await asyncio.to_thread(prefetch.discard)
+        only_files = None
+        if info.get('baseline') is not None:
+            only_files = await asyncio.to_thread(get_upload_delta, snapshot=snapshot, game=game, baseline=info['baseline'], remote_state=remote_state)
         log(f'Uploading data for {game}...')
-        success = await asyncio.to_thread(upload_save, config=config, games=games, entry=game, user_called=False)
+        success = await asyncio.to_thread(upload_save, config=config, games=games, entry=game, user_called=False, remote_state=remote_state, skip_unchanged=uploaded, only_files=only_files)
 
     if success:
-        send_notification(title=game, message='Save Synced')
+        queue_notification(title=game, message='Save Synced')
         log(f'Save for {game} synced')
     else:
-        send_notification(title='Error', message=f'Failed to sync save for {game}')
+        queue_notification(title='Error', message=f'Failed to sync save for {game}')
         log(f'Failed to sync save for {game}', 'error')
+    return success
+
+async def refresh_prefetch(game, prefetches, snapshot):
+    # Anything staged before the change is outdated now
+    prefetch = prefetches.pop(game, None)
+    if prefetch is not None:
+        await asyncio.to_thread(prefetch.discard)
+    await start_game_prefetch(game=game, prefetches=prefetches, snapshot=snapshot)
+
+def on_remote_change(game, running_games, live_syncs, prefetches, snapshot):
+    # Another machine uploaded a save for this game
+    if game in running_games:
+        queue_notification(title=game, message='Cloud save was updated from another device while the game is running')
+        log(f'Cloud save for {game} was updated from another device while it is running', 'warning')
+        # Live uploads would now overwrite the other device's save
+        live_sync = live_syncs.pop(game, None)
+        if live_sync is not None:
+            asyncio.create_task(asyncio.to_thread(live_sync.stop))
+        asyncio.create_task(refresh_prefetch(game=game, prefetches=prefetches, snapshot=snapshot))
+    else:
+        log(f'Cloud save for {game} was updated from another device')
+
+async def remote_feed_loop(registry, remote_state, running_games, live_syncs, prefetches):
+    from settings import REMOTE_POLL_INTERVAL
+    from connectivity import connectivity
+
+    while True:
+        try:
+            await connectivity.wait_online()
+            await asyncio.to_thread(remote_state.poll)
+            connectivity.report_success()
+        except Exception as e:
+            log(f'Error while polling remote changes: {e}', 'warning')
+            connectivity.report_error(e)
+        # Launch and exit checks poll too, so changes are collected from the mirror
+        for game in remote_state.take_changes():
+            on_remote_change(game=game, running_games=running_games, live_syncs=live_syncs, prefetches=prefetches, snapshot=registry.snapshot)
+        await asyncio.sleep(REMOTE_POLL_INTERVAL)
+
+# Deletes cloud files that are no longer part of any save, every REMOTE_GC_INTERVAL_HOURS
+async def remote_gc_loop(registry, remote_state, running_games):
+    from settings import REMOTE_GC_INTERVAL_HOURS
+    from connectivity import connectivity
+    from remote_gc import collect_garbage
+
+    while True:
+        await connectivity.wait_online()
+        snapshot = registry.snapshot
+        try:
+            await asyncio.to_thread(collect_garbage, config=snapshot.config, games=snapshot.games, user_called=False,
+                                    running_games=set(running_games), remote_state=remote_state)
+        except Exception as e:
+            log(f'Error during cloud cleanup: {e}', 'error')
+        await asyncio.sleep(REMOTE_GC_INTERVAL_HOURS * 3600)
+
+async def record_playtime(store, game, start_time, end_time):
+    playtime_hours = round((end_time - start_time) / 3600, 1)
+    queue_notification(title=game, message=f'You played for {playtime_hours} hours')
+    log(f'Played {game} for {playtime_hours}')
+    try:
+        new_playtime = await asyncio.to_thread(store.record_session, game, start_time, end_time)
+        log(f'Updated playtime for {game} is {new_playtime}')
+        if store.needs_compaction():
+            await asyncio.to_thread(store.compact)
+    except OSError as e:
+        log(f'Failed to record playtime for {game}: {e}', 'error')
 
 async def watch_loop():
-    from settings import POLL_INTERVAL, LOG_FILE_NAME, LOG_FOLDER, MAX_LOG_BYTES, LOG_BACKUP_COUNT, CLEAR_TRASH, RECORD_PLAYTIME, GAMES_FILE
-    from files import get_games_file
+    from settings import POLL_INTERVAL, LOG_FILE_NAME, LOG_FOLDER, MAX_LOG_BYTES, LOG_BACKUP_COUNT, CLEAR_TRASH, RECORD_PLAYTIME, REMOTE_GC_INTERVAL_HOURS
+    from registry import DaemonRegistry
+    from playtime import PlaytimeStore
+    from remote_state import RemoteStateMirror
+    from sync_queue import SyncQueue
+    from process_monitor import create_monitor, PatternMatcher, PollScheduler
+    from settings import LAUNCHER_PROCESSES
+    from loop_lag import lag_monitor, loop_stage
+    from throttle import sync_throttle
 
     # Logger setup
     if LOG_FOLDER:
@@ -209,43 +362,99 @@ async def watch_loop():
     log('Cloud Saves auto-sync starting up')
     log(f'Configuration: Poll interval {POLL_INTERVAL}s, Log rotation at {MAX_LOG_BYTES} bytes, {LOG_BACKUP_COUNT} backup files')
     
-    # Clear trash if enabled
+    # Logs whenever something holds up the event loop
+    lag_task = asyncio.create_task(lag_monitor.run())
+
+    # Clear trash if enabled. It runs in the background so watching starts right away
     if CLEAR_TRASH:
         from files import clear_trash
-        clear_trash(user_called=False)
-        log("Cleared excess trash backups")
 
-    target_patterns = get_target_patterns()
-    log(f"Watching for: {list(target_patterns.values())}")
+        async def clear_trash_in_background():
+            await asyncio.to_thread(clear_trash, user_called=False)
+            log("Cleared excess trash backups")
+        asyncio.create_task(clear_trash_in_background())
+
+    # Config and games are parsed once here and again only when the files change
+    registry = await asyncio.to_thread(DaemonRegistry)
+    target_patterns = await asyncio.to_thread(get_target_patterns, games=registry.snapshot.games)
+    log(f"Watching for: {list(target_patterns.patterns.values())}")
+
+    # Kernel process events on Linux where permitted, polling everywhere else
+    launcher_patterns = PatternMatcher({name: name for name in LAUNCHER_PROCESSES})
+    monitor = create_monitor(match_proc=is_match, launcher_patterns=launcher_patterns)
+    monitor.start()
+    monitor.set_patterns(target_patterns)
+    scheduler = PollScheduler()
 
     seen = {}  # {pid: game}
     state = {} # {pid: {game: game, latest: latest}}
     start_tasks = {} # {pid: asyncio task}
     running_games = set() # Track games currently running (for auto syncing)
     running_games_playtime = {} # Track playtime of running games 
-    syncing_games = set()  # Track games currently being synced
+    # Sessions are appended to a journal instead of rewriting games.json
+    playtime_store = await asyncio.to_thread(PlaytimeStore) if RECORD_PLAYTIME else None
+    exited_games = {} # {game: {game: game, latest: latest}} for games with a process still running
+    live_syncs = {} # {game: LiveSaveSync} for running games whose saves upload as they change
+    prefetches = {} # {game: SavePrefetch} for running games whose newer cloud save downloads in the background
+
+    # Keeping a local mirror of the cloud state so launches don't need a query
+    remote_state = await asyncio.to_thread(RemoteStateMirror, config=registry.snapshot.config)
+
+    async def run_sync_job(job, extras):
+        try:
+            info = {'game': job['game'], 'latest': job['latest'], 'baseline': job.get('baseline')}
+            return await on_process_exit(info=info, snapshot=registry.snapshot, remote_state=remote_state, live_sync=extras.get('live_sync'), prefetch=extras.get('prefetch'))
+        finally:
+            running_games.discard(job['game'])
+
+    def drop_sync_extras(extras):
+        if extras.get('live_sync') is not None:
+            asyncio.create_task(asyncio.to_thread(extras['live_sync'].stop))
+        if extras.get('prefetch') is not None:
+            asyncio.create_task(asyncio.to_thread(extras['prefetch'].discard))
+
+    # Exit syncs run through a persistent queue, so ones still pending survive a restart
+    sync_queue = SyncQueue(run_job=run_sync_job, drop_extras=drop_sync_extras)
+    sync_queue.start()
+
+    feed_task = asyncio.create_task(remote_feed_loop(registry=registry, remote_state=remote_state, running_games=running_games, live_syncs=live_syncs, prefetches=prefetches))
+    # Cloud cleanup runs once at startup and then on its interval
+    gc_task = asyncio.create_task(remote_gc_loop(registry=registry, remote_state=remote_state, running_games=running_games)) if REMOTE_GC_INTERVAL_HOURS else None
 
     # Watchdog setup
-    reload_flag = {'reload': False}
+    reload_flag = {'reload': False, 'config': False}
     def reload_callback():
         reload_flag['reload'] = True
+    def config_reload_callback():
+        reload_flag['config'] = True
 
     observer = Observer()
     log_handler = GamesFileHandler(reload_callback)
     observer.schedule(log_handler, path=os.getcwd(), recursive=False)
+    observer.schedule(ConfigFileHandler(config_reload_callback), path=os.getcwd(), recursive=False)
     observer.start()
 
     try:
         while True:
             # Reload game entries
             if reload_flag['reload']:
-                target_patterns = get_target_patterns()
-                log(f"Reloaded target patterns: {list(target_patterns.values())}")
                 reload_flag['reload'] = False
+                await asyncio.to_thread(registry.reload_games)
+                if playtime_store is not None:
+                    asyncio.create_task(asyncio.to_thread(playtime_store.reload))
+                target_patterns = await asyncio.to_thread(get_target_patterns, games=registry.snapshot.games)
+                monitor.set_patterns(target_patterns)
+                log(f"Reloaded target patterns: {list(target_patterns.patterns.values())}")
+            if reload_flag['config']:
+                reload_flag['config'] = False
+                await asyncio.to_thread(registry.reload_config)
+                remote_state.set_config(registry.snapshot.config)
                 
             if target_patterns:
                 try:
-                    current = snapshot_matches(target_patterns=target_patterns)
+                    scan_start = time.perf_counter()
+                    current = await monitor.snapshot()
+                    scan_seconds = time.perf_counter() - scan_start
                 except Exception as e:
                     log(f'Error during process monitoring: {e}', 'error')
                     await asyncio.sleep(POLL_INTERVAL)
@@ -267,20 +476,21 @@ async def watch_loop():
                             log(f'Error waiting for previous start task (PID {pid}): {e}', 'error')
                             continue
 
-                    # If we're not already waiting for the game to close, then add it to the list
-                    # of games that we wanna wait for
-                    if pid not in state.keys():
-                        # Only send notification if game is not already running (for case with multiple pids of same process)
-                        if game not in running_games:
-                            send_notification(title=game, message='Cloud saves is watching')
-                            log(f'Watching {game}')
-                            running_games.add(game)
-                        start_tasks[pid] = asyncio.create_task(on_process_start(state=state, pid=pid, current=current, running_games=running_games))
-                    
-                    # Do the same thing for playtime
-                    if RECORD_PLAYTIME:
-                        if game not in running_games_playtime:
-                            running_games_playtime[game] = time.time()
+                    with loop_stage('process start'):
+                        # If we're not already waiting for the game to close, then add it to the list
+                        # of games that we wanna wait for
+                        if pid not in state.keys():
+                            # Only send notification if game is not already running (for case with multiple pids of same process)
+                            if game not in running_games:
+                                queue_notification(title=game, message='Cloud saves is watching')
+                                log(f'Watching {game}')
+                                running_games.add(game)
+                            start_tasks[pid] = asyncio.create_task(on_process_start(state=state, pid=pid, current=current, running_games=running_games, snapshot=registry.snapshot, remote_state=remote_state, live_syncs=live_syncs, prefetches=prefetches))
+                        
+                        # Do the same thing for playtime
+                        if RECORD_PLAYTIME:
+                            if game not in running_games_playtime:
+                                running_games_playtime[game] = time.time()
 
                 for pid in ended_pids:
                     game = seen[pid]
@@ -293,50 +503,38 @@ async def watch_loop():
                         except Exception as e:
                             log(f'Error waiting for start task to complete (PID {pid}): {e}', 'error')
                             continue
-                    
-                    # state data for that task will now be availible if conditions were met
-                    if pid in state.keys():
-                        # Skip if this game is already being synced
-                        if game in syncing_games:
-                            log(f'Sync already in progress for {game}, skipping PID {pid}')
-                            state.pop(pid, None)
-                            continue
-                        
-                        syncing_games.add(game)
-                        info = state[pid]
-                        state.pop(pid, None)
+
+                    with loop_stage('process exit'):
+                        # Live syncing and pre-fetching end once the last process of the game is gone
+                        live_sync = live_syncs.pop(game, None) if game not in current.values() else None
+                        prefetch = prefetches.pop(game, None) if game not in current.values() else None
                         
-                        # Create wrapper task that removes game from syncing_games when done
-                        async def sync_wrapper(info, syncing_games):
-                            try:
-                                await on_process_exit(info=info)
-                            finally:
-                                syncing_games.discard(info['game'])
-                                running_games.discard(info['game'])
+                        # state data for that task will now be availible if conditions were met
+                        if pid in state.keys():
+                            exited_games[game] = state.pop(pid)
+
+                        # Games with several processes are synced once, after the last one exits
+                        if game in exited_games and game not in current.values():
+                            info = exited_games.pop(game)
+                            sync_queue.add(game=game, latest=info['latest'], extras={'live_sync': live_sync, 'prefetch': prefetch}, baseline=info.get('baseline'))
+                        elif game not in current.values():
+                            if live_sync is not None:
+                                asyncio.create_task(asyncio.to_thread(live_sync.stop))
+                            if prefetch is not None:
+                                asyncio.create_task(asyncio.to_thread(prefetch.discard))
                         
-                        asyncio.create_task(sync_wrapper(info=info, syncing_games=syncing_games))
-                    
-                    # Recording the playtime
-                    if RECORD_PLAYTIME:
-                        if game in running_games_playtime:
-                            games_file = get_games_file()
-
-                            start_time = running_games_playtime.pop(game)
-                            playtime = time.time() - start_time
-                            playtime_hours = round(playtime / 3600, 1)
-                            send_notification(title=game, message=f'You played for {playtime_hours} hours')
-                            log(f'Played {game} for {playtime_hours}')
-                            old_playtime = games_file[game].get('playtime', 0)              
-                            old_playtime = old_playtime * 3600
-
-                            new_playtime = round((old_playtime + playtime) / 3600, 1)
-                            log(f'Updated playtime for {game} is {new_playtime}')
-
-                            games_file[game]['playtime'] = new_playtime
-                            with open(GAMES_FILE, 'w') as f:
-                                json.dump(games_file, f, indent=4)
+                        # Recording the playtime
+                        if RECORD_PLAYTIME:
+                            if game in running_games_playtime:
+                                start_time = running_games_playtime.pop(game)
+                                asyncio.create_task(record_playtime(store=playtime_store, game=game, start_time=start_time, end_time=time.time()))
                 seen = current
-                await asyncio.sleep(POLL_INTERVAL)
+                # Sync transfers slow down while any watched game is running
+                sync_throttle.set_gaming(bool(current))
+                with loop_stage('poll scheduling'):
+                    interval = scheduler.update(monitor=monitor, running_count=len(set(current.values())), scan_seconds=scan_seconds)
+                # Returns early as soon as the monitor sees a process start or exit
+                await monitor.wait(interval)
             else:
                 # No target patterns found, wait longer before checking again
                 await asyncio.sleep(POLL_INTERVAL * 2)
@@ -347,6 +545,16 @@ async def watch_loop():
         log(f'Unexpected error in watch loop: {e}', 'error')
         raise
     finally:
+        for live_sync in live_syncs.values():
+            live_sync.stop()
+        for prefetch in prefetches.values():
+            prefetch.discard()
+        feed_task.cancel()
+        if gc_task is not None:
+            gc_task.cancel()
+        lag_task.cancel()
+        await sync_queue.close()
+        monitor.close()
         observer.stop()
         observer.join()
         log('Watch loop shut down complete')
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+import time
+
+from auto import is_match
+from process_monitor import MatchCache, PatternMatcher, scan_matches
+
+# Measures how long one process poll takes as the number of running processes grows,
+# comparing a full scan against the PID-keyed match cache auto.py uses
+# Usage: python bench_poll.py [process counts...] e.g. python bench_poll.py 0 100 500
+PATTERNS = PatternMatcher({f'Game {i}': f'benchgame{i}.exe' for i in range(20)})
+ROUNDS = 5
+
+def time_poll(poll):
+    start = time.perf_counter()
+    poll()
+    return (time.perf_counter() - start) * 1000
+
+def bench(extra_processes):
+    # Idle child processes that the poller has to look at but never matches
+    children = [
+        subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(600)'])
+        for _ in range(extra_processes)
+    ]
+    try:
+        full_scan = min(time_poll(lambda: scan_matches(target_patterns=PATTERNS, match_proc=is_match)) for _ in range(ROUNDS))
+
+        cache = MatchCache(match_proc=is_match)
+        cold_scan = time_poll(lambda: cache.scan(target_patterns=PATTERNS))
+        warm_scan = min(time_poll(lambda: cache.scan(target_patterns=PATTERNS)) for _ in range(ROUNDS))
+        process_count = len(cache.results)
+    finally:
+        for child in children:
+            child.kill()
+        for child in children:
+            child.wait()
+    return process_count, full_scan, cold_scan, warm_scan
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [0, 100, 500]
+    print(f'{"processes":>10} {"full scan ms":>13} {"cold cache ms":>14} {"warm cache ms":>14}')
+    for count in counts:
+        process_count, full_scan, cold_scan, warm_scan = bench(count)
+        print(f'{process_count:>10} {full_scan:>13.2f} {cold_scan:>14.2f} {warm_scan:>14.2f}')
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,6 @@
 import platform
 import os
 import logging
-import time
-import subprocess
 
 # Checks OS Type
 def get_platform():
@@ -12,29 +10,53 @@ def get_platform():
     else: return "unsupported"
 
 
-# Doesn't let the user continue until they have internet access
-def internet_check(host="8.8.8.8", port=53, timeout=3):
-    import socket
-    from rich import print 
+# Doesn't let the user continue until they have internet access. Only probes the first
+# time or after a request failed, see connectivity.py
+def internet_check():
+    from connectivity import connectivity
 
-    if is_auto_mode():
-        internet_logged = False
+    connectivity.ensure_online()
+
+# Lowers the CPU and I/O priority of the calling thread, used for background work
+def lower_thread_priority():
+    import threading
+
+    platform_name = get_platform()
+    try:
+        if platform_name == "linux":
+            import psutil
 
-    while True:
-        try:
-            socket.setdefaulttimeout(timeout)
-            socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
-            log('Internet connection confirmed')
-            return
-        except socket.error:
-            if is_auto_mode():
-                if not internet_logged:
-                    log('No internet detected, waiting...', 'warning')
-                    internet_logged = True
-                time.sleep(3)
-            else:
-                print("No internet access detected. Press 'Enter' to retry or 'Ctrl + C' to exit")
-                input()
+            # Linux threads are scheduled individually, so this only affects the current thread.
+            # Threads it starts inherit both priorities
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+            psutil.Process(threading.get_native_id()).ionice(psutil.IOPRIO_CLASS_BE, value=7)
+        elif platform_name == "windows":
+            import ctypes
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+    except Exception as e:
+        log(f'Could not lower thread priority: {e}', 'warning')
+
+# Runs func over items on a thread pool and yields the results as they finish. At most
+# window items are submitted at once, so a huge iterator of items never becomes a huge list
+# of futures, and items can be produced while earlier ones are still running
+def bounded_map(func, items, max_workers, window=None):
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    window = window or max_workers * 2
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for item in items:
+            pending.add(executor.submit(func, item))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
 
 def is_auto_mode():
     return os.environ.get('AUTO_MODE') == "1"
@@ -49,98 +71,9 @@ def log(message, level='info'):
         elif level == 'warning':
             logger.warning(message)
 
-def send_notification(title, message):
-    from settings import APP_NAME, ICON_PATH, SEND_NOTIFICATIONS, SOUND_ON_NOTIFICATION, NOTIFICATION_SOUND_PATH
-    from common import get_platform
-
-    if not is_auto_mode() or not SEND_NOTIFICATIONS:
-        return
-
-    platform_name = get_platform()
-
-    if platform_name == "linux":
-        # Build notify-send command
-        cmd = [
-            "notify-send",
-            title,
-            message,
-            "--app-name", APP_NAME
-        ]
-        if ICON_PATH:
-            cmd.extend(["--icon", ICON_PATH])
-
-        try:
-            subprocess.run(cmd, check=True)
-            
-            # Play sound if enabled
-            if SOUND_ON_NOTIFICATION and NOTIFICATION_SOUND_PATH and os.path.exists(NOTIFICATION_SOUND_PATH):
-                try:
-                    # Try to play sound using various Linux audio players
-                    sound_players = ["paplay", "aplay", "play", "ffplay"]
-                    sound_played = False
-                    
-                    for player in sound_players:
-                        try:
-                            if player == "ffplay":
-                                # ffplay needs special flags to not show window and auto-exit
-                                subprocess.run([player, "-nodisp", "-autoexit", NOTIFICATION_SOUND_PATH], 
-                                             check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                            else:
-                                subprocess.run([player, NOTIFICATION_SOUND_PATH], 
-                                             check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                            sound_played = True
-                            break
-                        except FileNotFoundError:
-                            continue
-                        except Exception:
-                            continue
-                    
-                    if not sound_played:
-                        log("No suitable audio player found. Install pulseaudio-utils, alsa-utils, sox, or ffmpeg for notification sounds.", 'warning')
-                except Exception as e:
-                    log(f"Failed to play notification sound: {e}", 'warning')
-            elif SOUND_ON_NOTIFICATION and NOTIFICATION_SOUND_PATH and not os.path.exists(NOTIFICATION_SOUND_PATH):
-                log(f"Notification sound file not found: {NOTIFICATION_SOUND_PATH}", 'warning')
-                
-        except FileNotFoundError:
-            log("'notify-send' not found. Install 'libnotify-bin'", 'error')
-        except Exception as e:
-            log(f"Failed to send Linux notification: {e}", 'error')
-    elif platform_name == "windows":
-        # Escape double quotes in message parts
-        title_esc = title.replace('"', '\\"')
-        message_esc = message.replace('"', '\\"')
-        icon_uri = f"file:///{os.path.abspath(ICON_PATH)}" if ICON_PATH else ""
-
-        ps_script = f'''
-        [Windows.UI.Notifications.ToastNotificationManager, Windows.UI.Notifications, ContentType = WindowsRuntime] > $null;
-        $template = [Windows.UI.Notifications.ToastNotificationManager]::GetTemplateContent([Windows.UI.Notifications.ToastTemplateType]::ToastImageAndText02);
-        $template.SelectSingleNode("//text[@id=1]").InnerText = "{title_esc}";
-        $template.SelectSingleNode("//text[@id=2]").InnerText = "{message_esc}";
-        if ("{icon_uri}" -ne "") {{
-            $template.SelectSingleNode("//image").SetAttribute("src", "{icon_uri}");
-        }}
-        $notifier = [Windows.UI.Notifications.ToastNotificationManager]::CreateToastNotifier("{APP_NAME}");
-        $toast = [Windows.UI.Notifications.ToastNotification]::new($template);
-        $notifier.Show($toast);
-        '''
-
-        # Ensure no window flashes
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+# Hands the notification to the dispatcher thread so the caller never waits on notify-send
+# or the sound player, see notifications.py
+def queue_notification(title, message, group=None, summary=None):
+    from notifications import dispatcher
 
-        subprocess.run(
-            [
-                "powershell",
-                "-NoProfile",
-                "-NonInteractive",
-                "-WindowStyle", "Hidden",
-                "-ExecutionPolicy", "Bypass",
-                "-Command", ps_script
-            ],
-            check=True,
-            startupinfo=startupinfo,
-            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
-        )
-    else:
-        log(f"Unsupported platform for notifications", 'error')
\ No newline at end of file
+    dispatcher.notify(title=title, message=message, group=group, summary=summary)
@@ -0,0 +1,109 @@
+import socket
+import threading
+import time
+
+from common import log, is_auto_mode
+
+PROBE_HOST = '8.8.8.8'
+PROBE_PORT = 53
+PROBE_TIMEOUT = 3
+RETRY_INTERVAL = 3 # Seconds between probes while offline
+
+# Shared view of whether the internet is reachable. It probes once, then trusts that result
+# until a real request fails with a network error, so syncing makes no extra connections.
+# While offline a background thread probes until the link is back and wakes every waiter
+class ConnectivityMonitor:
+    def __init__(self):
+        self.online = None # None until the first probe
+        self.condition = threading.Condition()
+        self.async_waiters = [] # [(loop, future)] waiting in an event loop
+        self.prober = None
+
+    def probe(self):
+        # create_connection takes its own timeout, unlike setdefaulttimeout it leaves other sockets alone
+        try:
+            with socket.create_connection((PROBE_HOST, PROBE_PORT), timeout=PROBE_TIMEOUT):
+                return True
+        except OSError:
+            return False
+
+    def set_online(self, online):
+        with self.condition:
+            if online == self.online:
+                return
+            self.online = online
+            if online:
+                self.condition.notify_all()
+                waiters, self.async_waiters = self.async_waiters, []
+            else:
+                waiters = []
+                self.start_prober()
+        if online:
+            log('Internet connection confirmed')
+            for loop, future in waiters:
+                loop.call_soon_threadsafe(resolve_future, future)
+        else:
+            log('No internet detected, waiting...', 'warning')
+
+    def start_prober(self):
+        # Only called with the condition held
+        if self.prober is None or not self.prober.is_alive():
+            self.prober = threading.Thread(target=self.probe_until_online, name='connectivity', daemon=True)
+            self.prober.start()
+
+    def probe_until_online(self):
+        while not self.probe():
+            time.sleep(RETRY_INTERVAL)
+        self.set_online(True)
+
+    # Called when a real request failed. Only network errors mark the link down
+    def report_error(self, error):
+        if is_network_error(error):
+            self.set_online(False)
+
+    # Called when a real request got through, which is proof enough without a probe
+    def report_success(self):
+        if self.online is not True:
+            self.set_online(True)
+
+    # Blocks until online. Only the first call ever probes while the link is up
+    def ensure_online(self):
+        from rich import print
+
+        if self.online is None:
+            self.set_online(self.probe())
+        if self.online:
+            return
+        if is_auto_mode():
+            with self.condition:
+                self.condition.wait_for(lambda: self.online)
+            return
+        while not self.online:
+            print("No internet access detected. Press 'Enter' to retry or 'Ctrl + C' to exit")
+            input()
+            if self.probe():
+                self.set_online(True)
+
+    # Same as ensure_online for code running in an event loop, without tying up a thread
+    async def wait_online(self):
+        import asyncio
+
+        if self.online is None:
+            self.set_online(await asyncio.to_thread(self.probe))
+        with self.condition:
+            if self.online:
+                return
+            future = asyncio.get_running_loop().create_future()
+            self.async_waiters.append((asyncio.get_running_loop(), future))
+        await future
+
+def resolve_future(future):
+    if not future.done():
+        future.set_result(True)
+
+def is_network_error(error):
+    import httpx
+
+    return isinstance(error, (httpx.NetworkError, httpx.TimeoutException, ConnectionError, socket.gaierror, socket.timeout))
+
+connectivity = ConnectivityMonitor()
@@ -9,7 +9,46 @@ from common import log
 from ui import int_range_input
 from game_entry import take_entry_input
 
+# Yields every file in a save folder that takes part in syncing, see save_rules.py.
+# Excluded folders are skipped without listing what is in them
+def iter_save_files(path:Path):
+    from save_rules import get_save_rules
+
+    path = Path(path)
+    rules = get_save_rules(path)
+    folders = [''] # Relative posix paths of folders left to walk
+    while folders:
+        relative_dir = folders.pop()
+        with os.scandir(path / relative_dir) as entries:
+            for entry in entries:
+                relative_path = f'{relative_dir}/{entry.name}' if relative_dir else entry.name
+                # Symlinked folders aren't followed, same as rglob
+                if entry.is_dir(follow_symlinks=False):
+                    if not rules.prunes_dir(relative_path):
+                        folders.append(relative_path)
+                elif entry.is_file() and rules.includes_file(relative_path):
+                    yield path / relative_path
+
+# Only files whose size or mtime changed since the last call for this folder are read again
 def hash_save_folder(path:Path):
+    from manifest import get_manifest
+
+    manifest = get_manifest(path)
+    manifest.refresh()
+    hash_result = manifest.folder_hash()
+    log(f'Calculated hash for {len(manifest.entries)} files in {path}: {hash_result[:11]}...')
+    return hash_result
+
+# Returns the local hash in the same format as cloud_hash, so rows uploaded before
+# per-file hashing still compare correctly
+def hash_for_comparison(path:Path, cloud_hash):
+    from manifest import HASH_PREFIX
+
+    if cloud_hash and not cloud_hash.startswith(HASH_PREFIX):
+        return legacy_hash_save_folder(path=path)
+    return hash_save_folder(path=path)
+
+def legacy_hash_save_folder(path:Path):
     from settings import SKIP_EXTENSIONS
     from common import log
 
@@ -34,48 +73,103 @@ def hash_save_folder(path:Path):
     log(f'Calculated hash for {file_count} files in {path}: {hash_result[:8]}...')             
     return hash_result
 
-def move_files(source_path, backup_path):
+# Moves a save folder into the trash. On the same filesystem this is a single rename of the
+# whole folder, however big the save is. Otherwise files are moved one by one, which only copies
+# them if the trash is on another drive. With keep_source an empty folder is left in its place.
+# If the game has include or exclude patterns only synced files are moved, the rest stay
+def backup_save(source_path:Path, backup_path:Path, keep_source=True):
     from common import log
-    
-    log(f'Moving files from {source_path} to backup at {backup_path}')
-    
-    # Creating trash, game and backup folders (if they don't already exist)
-    backup_path.mkdir(parents=True, exist_ok=True)
+    from save_rules import get_save_rules
+
+    # Creating trash and game folders (if they don't already exist)
+    backup_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if get_save_rules(source_path).has_patterns():
+        file_count = move_save_files(source_path=source_path, destination_path=backup_path)
+        log(f'Moved {file_count} synced files to backup at {backup_path}')
+        return
+
+    # A symlinked or mounted save folder has to stay where it is, only its contents can move
+    if not source_path.is_symlink() and not os.path.ismount(source_path):
+        try:
+            os.rename(source_path, backup_path)
+        except OSError as e:
+            log(f'Could not move {source_path} to backup as a whole, moving files one by one: {e}')
+        else:
+            if keep_source:
+                source_path.mkdir()
+                shutil.copymode(backup_path, source_path)
+            log(f'Moved {source_path} to backup at {backup_path}')
+            return
+
+    file_count, copied_count = move_tree(source_path=source_path, backup_path=backup_path)
+    if not keep_source:
+        source_path.rmdir()
+    log(f'Moved {file_count} files to backup at {backup_path} ({copied_count} had to be copied)')
+
+# Moves only the files iter_save_files yields and removes folders that end up empty.
+# Returns how many files were moved
+def move_save_files(source_path:Path, destination_path:Path):
+    # Listed first since the walk would otherwise see the folders change under it
+    files = list(iter_save_files(source_path))
+    for file in files:
+        destination_file = destination_path / file.relative_to(source_path)
+        destination_file.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(file), str(destination_file))
+    for folder, _, _ in os.walk(source_path, topdown=False):
+        if folder != str(source_path):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                # Still holds files that aren't synced
+                pass
+    return len(files)
+
+# Returns how many files were moved and how many of them had to be copied
+def move_tree(source_path:Path, backup_path:Path):
+    import errno
 
     file_count = 0
-    # Moving files to trash folder
-    for file in source_path.rglob("*"):
-        if file.is_file():
-            # Preserving the directory structure by geting relative path
-            relative_path = file.relative_to(source_path)
-            destination_path = backup_path / relative_path
-
-            # Making sure destination folders exist
-            destination_path.parent.mkdir(parents=True, exist_ok=True)
-
-            # Moving the file
-            shutil.move(str(file), str(destination_path))
+    copied_count = 0
+    cross_device = False
+    # Walking bottom-up so each folder is empty by the time it is removed
+    for folder, _, file_names in os.walk(source_path, topdown=False):
+        destination_folder = backup_path / os.path.relpath(folder, source_path)
+        destination_folder.mkdir(parents=True, exist_ok=True)
+        for file_name in file_names:
+            source_file = os.path.join(folder, file_name)
+            destination_file = destination_folder / file_name
+            if not cross_device:
+                try:
+                    os.replace(source_file, destination_file)
+                    file_count += 1
+                    continue
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    # The trash is on another drive, every other file will be too
+                    cross_device = True
+            shutil.copy2(source_file, destination_file)
+            os.unlink(source_file)
             file_count += 1
-
-    # Remove all empty folders (deepest first)
-    for folder in sorted(source_path.rglob("*"), reverse=True):
-        # Making sure folder is empty
-        if folder.is_dir() and not any(folder.iterdir()):
-            folder.rmdir()
-    
-    log(f'Moved {file_count} files to backup')
+            copied_count += 1
+        if folder != str(source_path):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                # Holds something os.walk didn't descend into, like a symlinked folder
+                pass
+    return file_count, copied_count
 
 def get_last_modified(folder: Path):
-    from settings import SKIP_EXTENSIONS
     from common import log
 
     latest_time = 0
     file_count = 0
-    for file in folder.rglob("*"):
-        if file.is_file() and file.suffix.lower() not in SKIP_EXTENSIONS:
-            mtime = file.stat().st_mtime
-            latest_time = max(latest_time, mtime)
-            file_count += 1
+    for file in iter_save_files(folder):
+        mtime = file.stat().st_mtime
+        latest_time = max(latest_time, mtime)
+        file_count += 1
     
     result = datetime.fromtimestamp(latest_time, timezone.utc).isoformat() if latest_time else None
     log(f'Found latest modification time from {file_count} files in {folder}: {result}')
@@ -110,7 +204,11 @@ def get_games_file():
 def clear_trash(user_called=True):
     from settings import TRASH_FOLDER, MAX_BACKUPS, GAMES_FILE
     from common import log
+    from trash_store import get_store_savings, format_size, trash_cleaner
     
+    # Backups an earlier run renamed for deletion but didn't get to delete
+    trash_cleaner.resume(TRASH_FOLDER)
+
     # If called programmatically (from auto.py), clear all games
     if not user_called:
         log('Starting automatic trash cleanup')
@@ -131,6 +229,9 @@ def clear_trash(user_called=True):
         return
     
     # If called from main menu, show options
+    saved_bytes = get_store_savings(TRASH_FOLDER)
+    if saved_bytes:
+        print(f'[blue]Backups in the trash share identical files, saving {format_size(saved_bytes)}[/]\n')
     input_message = '1: All games\n2: Specific game\n3: Return to main menu\nSelect what trash to clear'
     choice_num = int_range_input(input_message, 1, 3)
     print()
@@ -176,6 +277,7 @@ def clear_trash(user_called=True):
 
 def clear_single_trash(trash_folder, max_backups, game_name):
     from common import log
+    from trash_store import get_backup_sizes, select_excess_backups, forget_backups, trash_cleaner, format_size
     
     trash_path = Path(trash_folder)
     if not trash_path.exists():
@@ -190,55 +292,43 @@ def clear_single_trash(trash_folder, max_backups, game_name):
         return False
 
     try:
-        backups = sorted(
-            [f for f in game_trash_path.iterdir() if f.is_dir()],
-            key=lambda x: x.name,
-            reverse=True
-        )
+        backup_names = sorted([f.name for f in game_trash_path.iterdir() if f.is_dir()], reverse=True)
+        sizes = get_backup_sizes(trash_path, game_name, backup_names)
+        old_backups = select_excess_backups(backup_names, sizes, max_backups)
         
-        if len(backups) <= max_backups:
-            print(f'[blue]Game {game_name} has {len(backups)} backup(s) (within limit of {max_backups})[/]')
-            log(f'Game {game_name} has {len(backups)} backup(s) (within limit of {max_backups})')
+        if not old_backups:
+            total_size = format_size(sum(sizes.values()))
+            print(f'[blue]Game {game_name} has {len(backup_names)} backup(s) taking {total_size} (within limits)[/]')
+            log(f'Game {game_name} has {len(backup_names)} backup(s) taking {total_size} (within limits)')
             return False
         
-        deleted_count = 0
-        old_backups = backups[max_backups:]
+        deleted_backups = []
+        freed_bytes = sum(sizes[name] for name in old_backups)
         
-        print(f'[blue]Clearing {len(old_backups)} excess backups for {game_name}...[/]')
-        log(f'Clearing {len(old_backups)} excess backups for {game_name}')
+        print(f'[blue]Clearing {len(old_backups)} excess backups for {game_name} ({format_size(freed_bytes)})...[/]')
+        log(f'Clearing {len(old_backups)} excess backups for {game_name} ({format_size(freed_bytes)})')
         
         for old_backup in old_backups:
             try:
-                # Remove all files first
-                for file in old_backup.rglob("*"):
-                    if file.is_file():
-                        file.unlink()
-                
-                # Remove directories (deepest first)
-                for folder in sorted(old_backup.rglob("*"), reverse=True):
-                    if folder.is_dir():
-                        folder.rmdir()
-                
-                # Remove the backup folder itself
-                old_backup.rmdir()
-                deleted_count += 1
-                
-                log(f'Deleted backup: {old_backup.name}')
-                
+                # Only renamed here, the files are deleted in the background
+                trash_cleaner.delete(game_trash_path / old_backup, trash_path)
+                deleted_backups.append(old_backup)
+                log(f'Deleted backup: {old_backup}')
             except Exception as e:
                 log(f'Error deleting backup {old_backup}: {e}', 'error')
-                print(f'[red]Error deleting backup {old_backup.name}: {e}[/]')
+                print(f'[red]Error deleting backup {old_backup}: {e}[/]')
                 continue
         
-        if deleted_count > 0:
-            log(f'Cleared {deleted_count} old backups for {game_name}', 'info')
+        if deleted_backups:
+            forget_backups(trash_path, game_name, deleted_backups)
+            log(f'Cleared {len(deleted_backups)} old backups for {game_name}', 'info')
         
         # Remove game folder if it's empty
         if game_trash_path.exists() and not any(game_trash_path.iterdir()):
             game_trash_path.rmdir()
             log(f'Removed empty game folder {game_name}', 'info')
         
-        return deleted_count > 0
+        return len(deleted_backups) > 0
     except Exception as e:
         log(f'Error processing game folder {game_name}: {e}', 'error')
         print(f'[red]Error processing game folder {game_name}: {e}[/]')
@@ -71,6 +71,7 @@ def add_game_entry():
 def remove_game_entry(config, games=None, entry_name_to_del=None):
     from supabase_client import loop_supabase_validation, remove_supabase_files
     from settings import GAMES_FILE
+    from playtime import record_removal
 
     if loop_supabase_validation(config=config) == -1:
         return
@@ -87,7 +88,10 @@ def remove_game_entry(config, games=None, entry_name_to_del=None):
     
     print('\n[blue]Removing files from Supabase...[/]')
     client = supabase.create_client(config.url, config.api_key)
-    remove_supabase_files(config=config, client=client, entry_name_to_del=entry_name_to_del)
+    if not remove_supabase_files(config=config, client=client, entry_name_to_del=entry_name_to_del):
+        # Keeping the entry so removing it again deletes the files that are left
+        print(f'[red]{entry_name_to_del} was not removed. Try again to delete the remaining files[/]')
+        return
 
     # Removing table data
     try:
@@ -100,6 +104,7 @@ def remove_game_entry(config, games=None, entry_name_to_del=None):
 
     with open(GAMES_FILE, 'w') as f:
         json.dump(games, f, indent=4)
+    record_removal(game=entry_name_to_del)
 
     print(f'\n[green]{entry_name_to_del} has been removed from your games[/]')
 
@@ -115,14 +120,32 @@ def edit_entry_process(games, entry_name_to_edit, system):
     
     print(f'\n[green]{system.capitalize()} process name changed[/]')
 
+def edit_entry_rules(games, entry_name_to_edit):
+    from settings import GAMES_FILE
+
+    print("Patterns work like .gitignore and are separated by commas, e.g 'saves/*.sav, *.cfg' or 'shadercache/, screenshots/'")
+    for key in ('include', 'exclude'):
+        current = ', '.join(games[entry_name_to_edit].get(key, []))
+        value = Prompt.ask(f"Enter the {key} patterns for the game (press 'Enter' to keep them or enter '-' to remove them)", default=current).strip()
+        patterns = [pattern.strip() for pattern in value.split(',') if pattern.strip()] if value != '-' else []
+        if patterns:
+            games[entry_name_to_edit][key] = patterns
+        else:
+            games[entry_name_to_edit].pop(key, None)
+
+    with open(GAMES_FILE, 'w') as f:
+        json.dump(games, f, indent=4)
+
+    print('\n[green]Sync patterns changed[/]')
+
 def edit_game_entry(config):
     from ui import int_range_input
 
     games, entry_name_to_edit = take_entry_input(keyword='to edit')
-    input_message = "\n1: Entry name\n2: Windows path\n3: Windows process name\n4: Linux path\n5: Linux process name\n6: Return to main menu\nSelect what to edit"
+    input_message = "\n1: Entry name\n2: Windows path\n3: Windows process name\n4: Linux path\n5: Linux process name\n6: Sync patterns\n7: Return to main menu\nSelect what to edit"
     
     while True:
-        choice = int_range_input(input_message, 1, 6)
+        choice = int_range_input(input_message, 1, 7)
         print()
         match choice:
             case 1:
@@ -136,11 +159,15 @@ def edit_game_entry(config):
             case 5:
                 edit_entry_process(games=games, entry_name_to_edit=entry_name_to_edit, system="linux")
             case 6:
+                edit_entry_rules(games=games, entry_name_to_edit=entry_name_to_edit)
+            case 7:
                 return
             
 def edit_game_name(config, games, entry_name_to_edit):
-    from supabase_client import loop_supabase_validation, remove_supabase_files, list_all_supabase_files
+    from supabase_client import loop_supabase_validation, list_all_supabase_files
+    from remote_ops import transfer_remote_files, print_failures, record_pending_rename, finish_pending_rename
     from settings import GAMES_FILE
+    from playtime import record_rename
 
     if loop_supabase_validation(config=config) == -1:
         return
@@ -154,8 +181,7 @@ def edit_game_name(config, games, entry_name_to_edit):
         else:
             break
 
-    # Moving Supabase files and deleting old ones
-    # Also editing table data
+    # Moving Supabase files on the server and editing table data
     print(f'\n[blue]Editing Supabase data...[/]')
     client = supabase.create_client(config.url, config.api_key)
     files_to_move = list_all_supabase_files(config=config, client=client, folder=f"{entry_name_to_edit}/")
@@ -163,23 +189,21 @@ def edit_game_name(config, games, entry_name_to_edit):
         return
     # Cloud save files found
     if files_to_move:
-        for file_path in files_to_move:
-            try:
-                file_data = client.storage.from_(config.games_bucket).download(file_path)
-                new_path = file_path.replace(f"{entry_name_to_edit}/", f"{new_name}/")
-                client.storage.from_(config.games_bucket).upload(new_path, file_data)
-            except Exception as e:
-                print(f'[red]ERROR: {e}[/]')
-
-        try:
-            remove_supabase_files(config=config, client=client, entry_name_to_del=entry_name_to_edit)
-        except Exception as e:
-            print(f'[red]ERROR: {e}[/]')
+        pairs = [(file_path, f'{new_name}/{file_path[len(entry_name_to_edit) + 1:]}') for file_path in files_to_move]
+        # Kept until the table row follows, so cloud cleanup leaves a half moved folder alone
+        record_pending_rename(old_name=entry_name_to_edit, new_name=new_name)
+        failures = transfer_remote_files(config=config, client=client, pairs=pairs, operation='move')
+        if failures:
+            print_failures(failures=failures, action='move')
+            # Moved files are already under the new name, renaming again to it moves the rest
+            print(f'[red]{entry_name_to_edit} was not renamed. Rename it to {new_name} again to move the remaining files[/]')
+            return
 
         try:
             client.table(config.table_name).update({
                 config.required_columns['game_name']: new_name
             }).eq(config.required_columns['game_name'], entry_name_to_edit).execute()
+            finish_pending_rename(new_name=new_name)
         except Exception as e:
             print(f'[red]ERROR: {e}[/]')
     
@@ -195,6 +219,7 @@ def edit_game_name(config, games, entry_name_to_edit):
     
     with open(GAMES_FILE, 'w') as f:
         json.dump(new_games, f, indent=4)
+    record_rename(old_name=entry_name_to_edit, new_name=new_name)
 
     print(f'\n[green]Entry name successfully changed from {entry_name_to_edit} to {new_name}[/]')
 
@@ -251,6 +276,10 @@ def get_key_str(key):
         return 'Linux Path'
     elif key == 'playtime':
         return 'Playtime'
+    elif key == 'include':
+        return 'Include Patterns'
+    elif key == 'exclude':
+        return 'Exclude Patterns'
     else:
         return key.capitalize()
 
@@ -261,6 +290,7 @@ def get_val_str(key, val):
 def list_games(extra_info=True):
     from files import is_json_valid
     from settings import GAMES_FILE
+    from playtime import get_playtime_hours
 
     if not is_json_valid(GAMES_FILE):
         print('You have no game entries\n')
@@ -269,11 +299,15 @@ def list_games(extra_info=True):
     with open(GAMES_FILE, 'r') as f:
         games = json.load(f)
     
+    # auto.py records playtime in its own journal, the value in games.json is from older versions
+    playtime_hours = get_playtime_hours() if extra_info else {}
     for count, (game, data) in enumerate(games.items(), 1):
         print(f"[bold]{count}: {game}[/]")
+        if game in playtime_hours:
+            data['playtime'] = playtime_hours[game]
         if extra_info:
             for key, val in data.items():
-                val = str(val)
+                val = ', '.join(val) if isinstance(val, list) else str(val)
                 if val.strip():
                     print(f"[underline]{get_key_str(key=key)}:[/] [purple]{get_val_str(key=key, val=val)}[/]")
             print()
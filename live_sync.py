@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from pathlib import Path
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+import supabase
+
+from common import log, lower_thread_priority
+
+class SaveFolderHandler(FileSystemEventHandler):
+    def __init__(self, change_callback):
+        self.change_callback = change_callback
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.change_callback(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.change_callback(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.change_callback(event.dest_path)
+
+# Watches a game's save folder while it runs and uploads changed files in the background
+# once writes settle, so a crash mid session loses little and the exit sync has little left to do.
+# The table row isn't touched, the exit sync still writes the hash once the game closes
+class LiveSaveSync:
+    def __init__(self, config, entry, local_path):
+        self.config = config
+        self.entry = entry
+        self.local_path = Path(local_path)
+        self.pending = set() # Paths changed since the last upload
+        self.uploaded = {} # {relative path: (size, mtime_ns)} of files uploaded while the game ran
+        self.last_change = 0
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.stopping = False
+        self.observer = None
+        self.worker = None
+
+    def start(self):
+        self.observer = Observer()
+        self.observer.schedule(SaveFolderHandler(self.on_change), path=str(self.local_path), recursive=True)
+        self.observer.start()
+        self.worker = threading.Thread(target=self.run, name=f'live-sync-{self.entry}', daemon=True)
+        self.worker.start()
+        log(f'Live syncing save changes for {self.entry}')
+
+    def on_change(self, path):
+        from save_rules import get_save_rules
+
+        path = Path(path)
+        relative_path = Path(os.path.relpath(path, self.local_path)).as_posix()
+        if not get_save_rules(self.local_path).includes(relative_path):
+            return
+        with self.lock:
+            self.pending.add(path)
+            self.last_change = time.monotonic()
+        self.wake_event.set()
+
+    def run(self):
+        from settings import LIVE_SYNC_DEBOUNCE
+
+        # Keeping background uploads from competing with the game
+        lower_thread_priority()
+        client = None
+        while not self.stopping:
+            self.wake_event.wait()
+            self.wake_event.clear()
+            # Waiting until the game has stopped writing for a while
+            while not self.stopping:
+                with self.lock:
+                    quiet_for = time.monotonic() - self.last_change
+                if quiet_for >= LIVE_SYNC_DEBOUNCE:
+                    break
+                self.wake_event.wait(LIVE_SYNC_DEBOUNCE - quiet_for)
+                self.wake_event.clear()
+            if self.stopping:
+                break
+
+            with self.lock:
+                paths = self.pending
+                self.pending = set()
+            if not paths:
+                continue
+            try:
+                if client is None:
+                    client = supabase.create_client(self.config.url, self.config.api_key)
+                self.upload(client, paths)
+            except Exception as e:
+                log(f'Live sync upload failed for {self.entry}: {e}', 'warning')
+                # The files are retried on the next change or picked up by the exit sync
+                with self.lock:
+                    self.pending |= paths
+
+    def upload(self, client, paths):
+        from supabase_client import upload_file
+
+        uploaded_count = 0
+        for path in paths:
+            # Whatever is left gets uploaded by the exit sync
+            if self.stopping:
+                break
+            if not path.is_file():
+                continue
+            relative_path = path.relative_to(self.local_path).as_posix()
+            try:
+                # Stat before reading so a write during the upload makes the exit sync upload it again
+                before = path.stat()
+                _, error = upload_file(self.config, client, self.entry, path, self.local_path)
+                if error:
+                    with self.lock:
+                        self.pending.add(path)
+                    continue
+                after = path.stat()
+            except FileNotFoundError:
+                # Deleted while uploading, e.g. a temporary save file
+                continue
+            if (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns):
+                with self.lock:
+                    self.uploaded[relative_path] = (after.st_size, after.st_mtime_ns)
+            uploaded_count += 1
+        if uploaded_count:
+            log(f'Live synced {uploaded_count} changed files for {self.entry}')
+
+    # Stops watching and returns {relative path: (size, mtime_ns)} of the files already
+    # in the cloud. Blocks until an upload in progress finishes
+    def stop(self):
+        self.stopping = True
+        self.wake_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        if self.worker is not None:
+            self.worker.join()
+        log(f'Stopped live syncing {self.entry}')
+        with self.lock:
+            return dict(self.uploaded)
+
+def start_live_sync(config, games, entry):
+    from common import get_platform
+    from save_rules import set_save_rules
+
+    local_path = games[entry].get(f'{get_platform()}_path')
+    if not local_path or not os.path.isdir(local_path):
+        log(f'Not live syncing {entry}, the save directory is invalid: {local_path}', 'warning')
+        return None
+    set_save_rules(local_path, games[entry])
+    live_sync = LiveSaveSync(config=config, entry=entry, local_path=local_path)
+    live_sync.start()
+    return live_sync
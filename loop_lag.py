@@ -0,0 +1,40 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+from common import log
+
+# Measures how late the event loop wakes up a sleeping task. Anything that runs on the loop
+# without awaiting delays every process event behind it, so late wakeups are logged along
+# with the slowest stage that ran in the meantime
+class LoopLagMonitor:
+    def __init__(self):
+        self.stages = [] # [(seconds, name)] of stages that finished since the last check
+
+    # Wraps a section that runs on the loop without awaiting, so lag can be blamed on it
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((time.perf_counter() - start, name))
+
+    async def run(self):
+        from settings import LOOP_LAG_CHECK_INTERVAL, LOOP_LAG_THRESHOLD
+
+        while True:
+            expected = time.perf_counter() + LOOP_LAG_CHECK_INTERVAL
+            await asyncio.sleep(LOOP_LAG_CHECK_INTERVAL)
+            lag = time.perf_counter() - expected
+            stages, self.stages = self.stages, []
+            if lag < LOOP_LAG_THRESHOLD:
+                continue
+            if stages:
+                seconds, name = max(stages)
+                log(f'Event loop ran {lag:.2f}s behind, slowest stage: {name} ({seconds:.2f}s)', 'warning')
+            else:
+                log(f'Event loop ran {lag:.2f}s behind outside of tracked stages', 'warning')
+
+lag_monitor = LoopLagMonitor()
+loop_stage = lag_monitor.stage
@@ -0,0 +1,165 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from pathlib import Path
+
+from common import log
+
+# Folder hashes made from per-file digests start with this, older hashes are a plain md5
+# of every file's name and contents streamed together
+HASH_PREFIX = 'v2:'
+# Files modified this close to being hashed are hashed again next time, since a write
+# in the same clock tick wouldn't change their stats
+RACY_WINDOW_NS = 2 * 10**9
+
+# Per-file size, mtime and md5 of a save folder. Refreshing only re-hashes files whose
+# stats changed, so hashing a folder again after a game session only reads what it wrote
+class FolderManifest:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {} # {relative path: (size, mtime_ns, md5)}
+        self.hashed_at_ns = 0
+        # When entries recorded since the last refresh were hashed, see record_entries
+        self.recorded_at = {} # {relative path: ns}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        from files import iter_save_files
+
+        with self.lock:
+            started_ns = time.time_ns()
+            entries = {}
+            rehashed = 0
+            for file in iter_save_files(self.path):
+                relative_path = file.relative_to(self.path).as_posix()
+                stat = file.stat()
+                old = self.entries.get(relative_path)
+                racy = stat.st_mtime_ns >= self.entry_hashed_at(relative_path) - RACY_WINDOW_NS
+                if old is not None and old[:2] == (stat.st_size, stat.st_mtime_ns) and not racy:
+                    entries[relative_path] = old
+                    continue
+                entries[relative_path] = (stat.st_size, stat.st_mtime_ns, hash_file(file))
+                rehashed += 1
+            self.entries = entries
+            self.hashed_at_ns = started_ns
+            self.recorded_at = {}
+            log(f'Refreshed manifest for {self.path}: {len(entries)} files, {rehashed} hashed')
+            return rehashed
+
+    # Only called with the lock held
+    def entry_hashed_at(self, relative_path):
+        return self.recorded_at.get(relative_path, self.hashed_at_ns)
+
+    # Takes hashes made while reading the files for something else, like an upload.
+    # digests is {relative path: ((size, mtime_ns, md5), ns when reading started)}
+    def record_entries(self, digests):
+        with self.lock:
+            for relative_path, (entry, hashed_at_ns) in digests.items():
+                self.entries[relative_path] = entry
+                self.recorded_at[relative_path] = hashed_at_ns
+
+    def folder_hash(self):
+        return combine_file_hashes(self.file_hashes())
+
+    # Returns {relative path: (size, mtime_ns, md5)} of entries whose md5 still holds for a file
+    # with the same size and mtime, which rules out files written during the last refresh
+    def trusted_entries(self):
+        with self.lock:
+            return {relative_path: entry for relative_path, entry in self.entries.items()
+                    if entry[1] < self.entry_hashed_at(relative_path) - RACY_WINDOW_NS}
+
+    # Returns {relative path: md5} as of the last refresh
+    def file_hashes(self):
+        with self.lock:
+            return {relative_path: entry[2] for relative_path, entry in self.entries.items()}
+
+# Sorted so the hash is the same everytime, the relative path is included so moving or
+# renaming a file changes the hash too. file_hashes is {relative path: md5}
+def combine_file_hashes(file_hashes):
+    hasher = hashlib.md5()
+    for relative_path in sorted(file_hashes):
+        hasher.update(f'{relative_path}\0{file_hashes[relative_path]}\n'.encode())
+    return HASH_PREFIX + hasher.hexdigest()
+
+def hash_file(file):
+    hasher = hashlib.md5()
+    with open(file, 'rb') as f:
+        # Reading file in chunks to avoid crashes on big files
+        while chunk := f.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+# An open file that hashes whatever is read from it, so a file is hashed while it is uploaded
+# instead of being read a second time. Seeking back to the start, as a retried request does,
+# starts the hash over
+class HashingReader(io.BufferedReader):
+    def __init__(self, file):
+        super().__init__(io.FileIO(file, 'rb'), buffer_size=1024 * 1024)
+        stat = os.fstat(self.fileno())
+        self.stats = (stat.st_size, stat.st_mtime_ns)
+        self.opened_at_ns = time.time_ns()
+        self.hasher = hashlib.md5()
+        self.hashed_bytes = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.hasher.update(chunk)
+        self.hashed_bytes += len(chunk)
+        return chunk
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        position = super().seek(offset, whence)
+        if position == 0:
+            self.hasher = hashlib.md5()
+            self.hashed_bytes = 0
+        return position
+
+    # Returns (size, mtime_ns, md5) as a manifest entry, or None if the file wasn't read in full
+    def entry(self):
+        if self.hashed_bytes != self.stats[0]:
+            return None
+        return (*self.stats, self.hasher.hexdigest())
+
+# Manifests are kept for the life of the process, so the daemon only hashes a save
+# folder in full the first time it sees it
+manifests = {}
+manifests_lock = threading.Lock()
+
+def get_manifest(path):
+    key = os.path.abspath(path)
+    with manifests_lock:
+        manifest = manifests.get(key)
+        if manifest is None:
+            manifest = manifests[key] = FolderManifest(key)
+        return manifest
+
+# Starts the manifest of a copy of source_path from the source's trusted entries, so files
+# the copy shares with it aren't hashed again
+def seed_manifest(path, source_path):
+    source = get_manifest(source_path)
+    key = os.path.abspath(path)
+    manifest = FolderManifest(key)
+    manifest.entries = source.trusted_entries()
+    with source.lock:
+        manifest.hashed_at_ns = source.hashed_at_ns
+        manifest.recorded_at = {relative_path: hashed_at_ns for relative_path, hashed_at_ns in source.recorded_at.items()
+                                if relative_path in manifest.entries}
+    with manifests_lock:
+        manifests[key] = manifest
+    return manifest
+
+def forget_manifest(path):
+    with manifests_lock:
+        manifests.pop(os.path.abspath(path), None)
+
+# Refreshes the folder's manifest and returns {relative path: md5}
+def snapshot_file_hashes(path):
+    manifest = get_manifest(path)
+    manifest.refresh()
+    return manifest.file_hashes()
+
+# Relative paths whose contents differ from the baseline, including new files
+def changed_files(baseline, file_hashes):
+    return {relative_path for relative_path, md5 in file_hashes.items() if baseline.get(relative_path) != md5}
@@ -0,0 +1,173 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from common import log, get_platform, is_auto_mode
+
+SOUND_PLAYERS = ["paplay", "aplay", "play", "ffplay"]
+
+# Sends notifications from one background thread so a sync or the watch loop never waits on
+# notify-send, PowerShell or the sound player. Notifications sent within
+# NOTIFICATION_COALESCE_WINDOW of each other go out as one batch, where repeats are dropped
+# and notifications of the same group are combined into one summary
+class NotificationDispatcher:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = [] # [(title, message, group, summary)]
+        self.thread = None
+        self.sound_player = None
+        self.players_checked = False
+
+    # group names notifications that are combined when several arrive in one batch, summary is
+    # the message sent instead and may contain {count}
+    def notify(self, title, message, group=None, summary=None):
+        from settings import SEND_NOTIFICATIONS
+
+        if not is_auto_mode() or not SEND_NOTIFICATIONS:
+            return
+        with self.condition:
+            self.pending.append((title, message, group, summary))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='notifications', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def run(self):
+        from settings import NOTIFICATION_COALESCE_WINDOW
+
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+            # Letting the rest of a burst arrive before sending
+            time.sleep(NOTIFICATION_COALESCE_WINDOW)
+            with self.condition:
+                batch, self.pending = self.pending, []
+            try:
+                self.send(coalesce_notifications(batch))
+            except Exception as e:
+                log(f'Failed to send notifications: {e}', 'error')
+
+    def send(self, notifications):
+        platform_name = get_platform()
+        if platform_name == "linux":
+            for title, message in notifications:
+                if not send_linux_notification(title, message):
+                    return
+            # One sound per batch, however many notifications it had
+            self.play_sound()
+        elif platform_name == "windows":
+            send_windows_notifications(notifications)
+        else:
+            log(f"Unsupported platform for notifications", 'error')
+
+    def play_sound(self):
+        from settings import SOUND_ON_NOTIFICATION, NOTIFICATION_SOUND_PATH
+
+        if not SOUND_ON_NOTIFICATION or not NOTIFICATION_SOUND_PATH:
+            return
+        if not os.path.exists(NOTIFICATION_SOUND_PATH):
+            log(f"Notification sound file not found: {NOTIFICATION_SOUND_PATH}", 'warning')
+            return
+        # Looking for an audio player once instead of trying each one on every notification
+        if not self.players_checked:
+            self.players_checked = True
+            self.sound_player = next((player for player in SOUND_PLAYERS if shutil.which(player)), None)
+            if self.sound_player is None:
+                log("No suitable audio player found. Install pulseaudio-utils, alsa-utils, sox, or ffmpeg for notification sounds.", 'warning')
+            else:
+                log(f'Playing notification sounds with {self.sound_player}')
+        if self.sound_player is None:
+            return
+
+        if self.sound_player == "ffplay":
+            # ffplay needs special flags to not show window and auto-exit
+            cmd = [self.sound_player, "-nodisp", "-autoexit", NOTIFICATION_SOUND_PATH]
+        else:
+            cmd = [self.sound_player, NOTIFICATION_SOUND_PATH]
+        try:
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except Exception as e:
+            log(f"Failed to play notification sound: {e}", 'warning')
+
+# Returns [(title, message)] in the order the notifications were first sent
+def coalesce_notifications(batch):
+    grouped = {} # {key: [title, message, summary, count]}
+    for title, message, group, summary in batch:
+        key = (title, group) if group is not None else (title, message)
+        if key in grouped:
+            grouped[key][3] += 1
+        else:
+            grouped[key] = [title, message, summary, 1]
+
+    notifications = []
+    for title, message, summary, count in grouped.values():
+        if count > 1 and summary:
+            message = summary.format(count=count)
+        notifications.append((title, message))
+    return notifications
+
+# Returns False if notify-send is missing, so the rest of the batch isn't tried
+def send_linux_notification(title, message):
+    from settings import APP_NAME, ICON_PATH
+
+    cmd = [
+        "notify-send",
+        title,
+        message,
+        "--app-name", APP_NAME
+    ]
+    if ICON_PATH:
+        cmd.extend(["--icon", ICON_PATH])
+    try:
+        subprocess.run(cmd, check=True)
+    except FileNotFoundError:
+        log("'notify-send' not found. Install 'libnotify-bin'", 'error')
+        return False
+    except Exception as e:
+        log(f"Failed to send Linux notification: {e}", 'error')
+    return True
+
+# Shows every toast of the batch from a single PowerShell process, starting it is the slow part
+def send_windows_notifications(notifications):
+    from settings import APP_NAME, ICON_PATH
+
+    icon_uri = f"file:///{os.path.abspath(ICON_PATH)}" if ICON_PATH else ""
+    ps_script = f'''
+    [Windows.UI.Notifications.ToastNotificationManager, Windows.UI.Notifications, ContentType = WindowsRuntime] > $null;
+    $notifier = [Windows.UI.Notifications.ToastNotificationManager]::CreateToastNotifier("{APP_NAME}");
+    '''
+    for title, message in notifications:
+        # Escape double quotes in message parts
+        title_esc = title.replace('"', '\\"')
+        message_esc = message.replace('"', '\\"')
+        ps_script += f'''
+        $template = [Windows.UI.Notifications.ToastNotificationManager]::GetTemplateContent([Windows.UI.Notifications.ToastTemplateType]::ToastImageAndText02);
+        $template.SelectSingleNode("//text[@id=1]").InnerText = "{title_esc}";
+        $template.SelectSingleNode("//text[@id=2]").InnerText = "{message_esc}";
+        if ("{icon_uri}" -ne "") {{
+            $template.SelectSingleNode("//image").SetAttribute("src", "{icon_uri}");
+        }}
+        $notifier.Show([Windows.UI.Notifications.ToastNotification]::new($template));
+        '''
+
+    # Ensure no window flashes
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    subprocess.run(
+        [
+            "powershell",
+            "-NoProfile",
+            "-NonInteractive",
+            "-WindowStyle", "Hidden",
+            "-ExecutionPolicy", "Bypass",
+            "-Command", ps_script
+        ],
+        check=True,
+        startupinfo=startupinfo,
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+    )
+
+dispatcher = NotificationDispatcher()
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+
+from common import log
+
+# Playtime is kept in an append-only journal with one JSON record per line:
+#   {"game", "start", "end", "duration"}  a play session
+#   {"game", "duration"}                  a total written by compaction or carried over from games.json
+#   {"rename", "to"}                      a game entry was renamed
+#   {"remove"}                            a game entry was removed
+# Durations are in seconds. Recording a session only appends a line, games.json isn't touched
+
+def read_playtime_journal(journal_file=None):
+    from settings import PLAYTIME_FILE
+
+    journal_file = journal_file or PLAYTIME_FILE
+    totals = {} # {game: seconds}
+    line_count = 0
+    if not os.path.exists(journal_file):
+        return totals, line_count
+    with open(journal_file, 'r') as f:
+        for line in f:
+            line_count += 1
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash, the rest of the journal is still good
+                log(f'Skipping invalid line {line_count} in {journal_file}', 'warning')
+                continue
+            if 'rename' in record:
+                if record['rename'] in totals:
+                    totals[record['to']] = totals.get(record['to'], 0) + totals.pop(record['rename'])
+            elif 'remove' in record:
+                totals.pop(record['remove'], None)
+            else:
+                totals[record['game']] = totals.get(record['game'], 0) + record['duration']
+    return totals, line_count
+
+def append_playtime_record(record, journal_file=None):
+    from settings import PLAYTIME_FILE
+
+    with open(journal_file or PLAYTIME_FILE, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+# Returns {game: hours} for displaying, or an empty dict if auto.py never recorded playtime
+def get_playtime_hours():
+    totals, _ = read_playtime_journal()
+    return {game: round(seconds / 3600, 1) for game, seconds in totals.items()}
+
+# Renames and removals are only journaled once there is a journal to keep consistent
+def record_rename(old_name, new_name):
+    from settings import PLAYTIME_FILE
+
+    if os.path.exists(PLAYTIME_FILE):
+        append_playtime_record({'rename': old_name, 'to': new_name})
+
+def record_removal(game):
+    from settings import PLAYTIME_FILE
+
+    if os.path.exists(PLAYTIME_FILE):
+        append_playtime_record({'remove': game})
+
+# The daemon's view of the journal. Totals are served from memory and the journal is
+# compacted to one line per game once it grows past PLAYTIME_COMPACT_LINES
+class PlaytimeStore:
+    def __init__(self, journal_file=None):
+        from settings import PLAYTIME_FILE
+
+        self.journal_file = journal_file or PLAYTIME_FILE
+        self.lock = threading.Lock()
+        if not os.path.exists(self.journal_file):
+            self.import_games_file()
+        self.totals, self.line_count = read_playtime_journal(self.journal_file)
+        log(f'Loaded playtime for {len(self.totals)} games from {self.line_count} journal lines')
+
+    # Playtime used to be stored in hours in games.json, it is carried over once
+    def import_games_file(self):
+        from files import get_games_file
+
+        games = get_games_file()
+        with open(self.journal_file, 'a') as f:
+            for game, data in games.items():
+                if data.get('playtime'):
+                    f.write(json.dumps({'game': game, 'duration': data['playtime'] * 3600}) + '\n')
+        log(f'Created playtime journal {self.journal_file} from {len(games)} game entries')
+
+    def get_hours(self, game):
+        with self.lock:
+            return round(self.totals.get(game, 0) / 3600, 1)
+
+    # Appends the session and returns the game's new total in hours
+    def record_session(self, game, start, end):
+        duration = end - start
+        with self.lock:
+            append_playtime_record({'game': game, 'start': start, 'end': end, 'duration': duration}, self.journal_file)
+            self.line_count += 1
+            self.totals[game] = self.totals.get(game, 0) + duration
+            return round(self.totals[game] / 3600, 1)
+
+    def needs_compaction(self):
+        from settings import PLAYTIME_COMPACT_LINES
+
+        return self.line_count > PLAYTIME_COMPACT_LINES
+
+    # Picks up renames and removals the CLI appended
+    def reload(self):
+        with self.lock:
+            self.totals, self.line_count = read_playtime_journal(self.journal_file)
+
+    def compact(self):
+        with self.lock:
+            # Read from disk again so records the CLI appended aren't lost
+            totals, line_count = read_playtime_journal(self.journal_file)
+            # Writing to a temp file first so a crash never leaves a half written journal
+            temp_file = f'{self.journal_file}.tmp'
+            with open(temp_file, 'w') as f:
+                for game, seconds in totals.items():
+                    f.write(json.dumps({'game': game, 'duration': seconds}) + '\n')
+            os.replace(temp_file, self.journal_file)
+            self.totals = totals
+            self.line_count = len(totals)
+        log(f'Compacted playtime journal from {line_count} to {len(totals)} lines')
@@ -0,0 +1,178 @@
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+import supabase
+
+from common import log, lower_thread_priority
+
+# Downloads a newer cloud save into a staging folder next to the save folder while the game
+# runs. Once the game closes the staged folder is swapped in with renames, so the user waits
+# for two renames instead of a full download. The staging folder sits on the same drive as
+# the save folder, which keeps the renames atomic
+class SavePrefetch:
+    def __init__(self, config, entry, local_path):
+        self.config = config
+        self.entry = entry
+        self.local_path = Path(local_path)
+        self.staging_path = self.local_path.parent / f'.{self.local_path.name}.prefetch'
+        self.replaced_path = self.local_path.parent / f'.{self.local_path.name}.replaced'
+        self.cloud_hash = None # Hash of the cloud row the staged files were downloaded for
+        self.complete = False
+        self.cancelled = False
+        self.worker = None
+
+    def start(self):
+        self.worker = threading.Thread(target=self.run, name=f'prefetch-{self.entry}', daemon=True)
+        self.worker.start()
+        log(f'Pre-fetching cloud save for {self.entry} into {self.staging_path}')
+
+    def run(self):
+        from supabase_client import download_file, list_all_supabase_files
+        from save_rules import copy_save_rules, get_save_rules
+
+        # Keeping the download from competing with the game
+        lower_thread_priority()
+        try:
+            # Left over from a pre-fetch that never finished
+            if self.staging_path.exists():
+                shutil.rmtree(self.staging_path)
+            self.staging_path.mkdir(parents=True)
+
+            client = supabase.create_client(self.config.url, self.config.api_key)
+            self.cloud_hash = self.get_cloud_hash(client)
+            if self.cloud_hash is None:
+                log(f'No table data found for {self.entry}, not pre-fetching', 'warning')
+                return
+
+            files_to_download = list_all_supabase_files(config=self.config, client=client, folder=f'{self.entry}/')
+            if files_to_download == -1 or not files_to_download:
+                log(f'No cloud files found to pre-fetch for {self.entry}', 'warning')
+                return
+            # The staged save is hashed with the save folder's patterns, so files they leave out
+            # aren't needed
+            copy_save_rules(self.staging_path, self.local_path)
+            rules = get_save_rules(self.local_path)
+            files_to_download = [file_path for file_path in files_to_download if rules.includes(file_path[len(self.entry) + 1:])]
+
+            for file_path in files_to_download:
+                # Whatever is missing gets downloaded normally at exit
+                if self.cancelled:
+                    return
+                _, error = download_file(self.config, client, self.entry, file_path, self.staging_path)
+                if error:
+                    log(f'Pre-fetch for {self.entry} failed, the save will be downloaded at exit: {error}', 'warning')
+                    return
+            self.complete = True
+            log(f'Pre-fetched {len(files_to_download)} files for {self.entry}')
+        except Exception as e:
+            log(f'Pre-fetch for {self.entry} failed, the save will be downloaded at exit: {e}', 'warning')
+
+    def get_cloud_hash(self, client):
+        columns = self.config.required_columns
+        response = client.table(self.config.table_name).select(columns['hash']).eq(columns['game_name'], self.entry).execute()
+        return response.data[0][columns['hash']] if response.data else None
+
+    # Swaps the staged save in, moving the current save to the trash like a normal download.
+    # Returns False if the staged files can't be used, the caller should download normally then
+    def finish(self):
+        from files import backup_save, move_tree
+        from save_rules import copy_save_rules
+        from manifest import get_manifest
+        from trash_store import add_backup
+
+        if self.worker is not None:
+            self.worker.join()
+        if not self.complete:
+            self.discard()
+            return False
+
+        try:
+            # Another device may have uploaded again since the files were staged
+            client = supabase.create_client(self.config.url, self.config.api_key)
+            cloud_hash = self.get_cloud_hash(client)
+            if cloud_hash != self.cloud_hash:
+                log(f'Cloud save for {self.entry} changed since it was pre-fetched', 'warning')
+                self.discard()
+                return False
+            if not self.verify_staging(cloud_hash):
+                log(f'Pre-fetched files for {self.entry} do not match the cloud hash', 'warning')
+                self.discard()
+                return False
+
+            if self.replaced_path.exists():
+                shutil.rmtree(self.replaced_path)
+            known_entries = get_manifest(self.local_path).trusted_entries()
+            self.local_path.rename(self.replaced_path)
+            try:
+                self.staging_path.rename(self.local_path)
+            except OSError:
+                # Putting the original save back before giving up
+                self.replaced_path.rename(self.local_path)
+                raise
+        except Exception as e:
+            log(f'Could not swap in pre-fetched save for {self.entry}: {e}', 'warning')
+            self.discard()
+            return False
+
+        log(f'Swapped in pre-fetched save for {self.entry}')
+        # Same backup location download_save uses
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        backup_path = Path(__file__).parent / "Trash" / self.entry / timestamp
+        try:
+            # The replaced save follows the save folder's include and exclude patterns
+            copy_save_rules(self.replaced_path, self.local_path)
+            backup_save(source_path=self.replaced_path, backup_path=backup_path, keep_source=False)
+            add_backup(backup_path=backup_path, known_entries=known_entries)
+            # Files the patterns leave out of syncing stay behind, they belong with the new save
+            if self.replaced_path.exists():
+                move_tree(source_path=self.replaced_path, backup_path=self.local_path)
+                self.replaced_path.rmdir()
+        except OSError as e:
+            log(f'Could not move replaced save for {self.entry} to the trash: {e}', 'warning')
+        return True
+
+    # Uploads never delete cloud files, so files deleted from the save on some device are still
+    # in the bucket and get staged too. When the staged save doesn't match the cloud hash, the
+    # staged files the local save doesn't have are left out, and if the rest match they were
+    # such leftovers and are deleted
+    def verify_staging(self, cloud_hash):
+        from files import hash_for_comparison
+        from manifest import HASH_PREFIX, combine_file_hashes, get_manifest, snapshot_file_hashes
+
+        if hash_for_comparison(path=self.staging_path, cloud_hash=cloud_hash) == cloud_hash:
+            return True
+        # Older hashes don't cover files one at a time
+        if not cloud_hash or not cloud_hash.startswith(HASH_PREFIX):
+            return False
+        staged = get_manifest(self.staging_path).file_hashes()
+        extra = staged.keys() - snapshot_file_hashes(self.local_path).keys()
+        if not extra or combine_file_hashes({relative_path: md5 for relative_path, md5 in staged.items() if relative_path not in extra}) != cloud_hash:
+            return False
+        for relative_path in extra:
+            (self.staging_path / relative_path).unlink()
+        log(f'Left {len(extra)} files out of the pre-fetched save for {self.entry} that are no longer part of the cloud save: {sorted(extra)}')
+        return True
+
+    # Stops the download and deletes anything staged. Blocks until a file in progress finishes
+    def discard(self):
+        self.cancelled = True
+        if self.worker is not None and self.worker is not threading.current_thread():
+            self.worker.join()
+        if self.staging_path.exists():
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+            log(f'Discarded pre-fetched save for {self.entry}')
+
+def start_prefetch(config, games, entry):
+    from common import get_platform
+    from save_rules import set_save_rules
+
+    local_path = games[entry].get(f'{get_platform()}_path')
+    if not local_path or not os.path.isdir(local_path):
+        log(f'Not pre-fetching {entry}, the save directory is invalid: {local_path}', 'warning')
+        return None
+    set_save_rules(local_path, games[entry])
+    prefetch = SavePrefetch(config=config, entry=entry, local_path=local_path)
+    prefetch.start()
+    return prefetch
@@ -0,0 +1,490 @@
+import asyncio
+import errno
+import os
+import re
+import socket
+import struct
+import time
+import psutil
+
+from common import log, get_platform
+from loop_lag import loop_stage
+
+PROC_ATTRS = ["pid", "name", "exe", "cmdline"]
+
+# Netlink proc connector constants (linux/netlink.h, linux/connector.h, linux/cn_proc.h)
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+NLMSG_DONE = 3
+PROC_CN_MCAST_LISTEN = 1
+PROC_EVENT_FORK = 0x00000001
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_COMM = 0x00000200
+PROC_EVENT_EXIT = 0x80000000
+
+NLMSG_HEADER = struct.Struct('=IHHII') # len, type, flags, seq, pid
+CN_MSG_HEADER = struct.Struct('=IIIIHH') # idx, val, seq, ack, len, flags
+PROC_EVENT_HEADER = struct.Struct('=IIQ') # what, cpu, timestamp
+PROC_EVENT_IDS = struct.Struct('=II') # pid, tgid (fork events have a second pair for the child)
+
+# Matches every game's process pattern against a string in a single regex pass, so a
+# catalog of hundreds of games costs about the same per process as one game
+class PatternMatcher:
+    def __init__(self, target_patterns):
+        self.patterns = dict(target_patterns) # {game: pattern}
+        # Earlier games win when several patterns match, same as checking them in order
+        self.owners = {} # {lowercase pattern: (catalog index, game)}
+        for index, (game, pattern) in enumerate(self.patterns.items()):
+            pattern = pattern.lower()
+            if pattern and pattern not in self.owners:
+                self.owners[pattern] = (index, game)
+
+        # The regex finds the longest pattern starting at each position, and any shorter
+        # pattern inside it matches too, so each pattern maps to the best game it implies
+        self.best = {}
+        for pattern in self.owners:
+            self.best[pattern] = min(owner for inner, owner in self.owners.items() if inner in pattern)
+
+        if self.owners:
+            alternatives = sorted(self.owners, key=len, reverse=True)
+            # The lookahead lets matches overlap, so no pattern hides another
+            self.regex = re.compile('(?=(' + '|'.join(re.escape(p) for p in alternatives) + '))')
+        else:
+            self.regex = None
+
+    def __len__(self):
+        return len(self.owners)
+
+    # Returns the game whose pattern occurs in text, or None
+    def match(self, text):
+        if self.regex is None:
+            return None
+        best = None
+        for found in self.regex.finditer(text.lower()):
+            owner = self.best[found.group(1)]
+            if best is None or owner < best:
+                best = owner
+                # Nothing can beat the first game in the catalog
+                if best[0] == 0:
+                    break
+        return best[1] if best else None
+
+# Returns {pid: game} for every running process that matches a target pattern
+def scan_matches(target_patterns, match_proc):
+    matches = {}
+    for proc in psutil.process_iter(PROC_ATTRS):
+        match_found, game = match_proc(target_patterns=target_patterns, proc=proc)
+        if match_found:
+            matches[proc.info["pid"]] = game
+    return matches
+
+# Remembers the match result of every process keyed by (pid, create_time, name), so each
+# poll only reads those three and evaluates processes that appeared or exec'd since the
+# last one. The cmdline and exe are only read for those, and only when the name doesn't
+# match on its own. An exec that keeps the name (python running another script) isn't
+# noticed until the process restarts, reading every cmdline on every poll to catch it
+# costs more than the cache saves
+class MatchCache:
+    def __init__(self, match_proc, launcher_patterns=None):
+        self.match_proc = match_proc
+        self.launcher_patterns = launcher_patterns
+        self.results = {} # {(pid, create_time, name): (game, is_launcher)}
+        self.launchers = set() # pids of running game launchers
+
+    def clear(self):
+        self.results = {}
+
+    def scan(self, target_patterns):
+        matches = {}
+        results = {}
+        launchers = set()
+        for proc in psutil.process_iter(["pid", "name", "create_time"]):
+            pid = proc.info["pid"]
+            # exec keeps the pid and create time but usually changes the name
+            key = (pid, proc.info["create_time"], proc.info["name"])
+            cached = self.results.get(key)
+            if cached is not None:
+                game, is_launcher = cached
+            else:
+                # Launchers are recognised by name alone, which is already fetched
+                is_launcher = bool(self.launcher_patterns) and self.launcher_patterns.match(proc.info["name"] or "") is not None
+                game = self.evaluate(target_patterns=target_patterns, proc=proc)
+            # Building a new dict each scan drops processes that exited
+            results[key] = (game, is_launcher)
+            if game is not None:
+                matches[pid] = game
+            if is_launcher:
+                launchers.add(pid)
+        self.results = results
+        self.launchers = launchers
+        return matches
+
+    def evaluate(self, target_patterns, proc):
+        # The name is already known, so try it on its own first, then add the cmdline and
+        # only then resolve the exe path
+        match_found, game = self.match_proc(target_patterns=target_patterns, proc=proc)
+        if match_found:
+            return game
+        for attr in ["cmdline", "exe"]:
+            try:
+                proc.info.update(proc.as_dict(attrs=[attr]))
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                return None
+            match_found, game = self.match_proc(target_patterns=target_patterns, proc=proc)
+            if match_found:
+                return game
+        return None
+
+# Scans every process each poll. Works on every platform, and on Linux watches
+# matched processes through pidfds so exits wake the loop right away
+class PollingMonitor:
+    event_driven = False
+
+    def __init__(self, match_proc, launcher_patterns=None):
+        self.cache = MatchCache(match_proc=match_proc, launcher_patterns=launcher_patterns)
+        self.target_patterns = {}
+        self.loop = None
+        self.wake_event = asyncio.Event()
+        self.exit_watchers = {} # {pid: pidfd}
+        self.use_pidfd = hasattr(os, 'pidfd_open')
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    def set_patterns(self, target_patterns):
+        self.target_patterns = target_patterns
+        # Cached results are only valid for the patterns they were computed with
+        self.cache.clear()
+
+    @property
+    def launchers(self):
+        return self.cache.launchers
+
+    # True when exits wake the loop on their own, so polling isn't needed to see them
+    @property
+    def instant_exits(self):
+        return self.use_pidfd and self.loop is not None
+
+    # The scan reads /proc for every process, so it runs in a worker thread
+    async def snapshot(self):
+        matches = await asyncio.to_thread(self.cache.scan, target_patterns=self.target_patterns)
+        if self.use_pidfd and self.loop is not None:
+            self.update_exit_watchers(matches)
+        return matches
+
+    def update_exit_watchers(self, matches):
+        for pid in self.exit_watchers.keys() - matches.keys():
+            self.remove_exit_watcher(pid)
+        for pid in matches.keys() - self.exit_watchers.keys():
+            try:
+                pidfd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                # Exited between the scan and here, so scan again soon to report it
+                self.wake_event.set()
+                continue
+            except OSError as e:
+                if e.errno in (errno.ENOSYS, errno.EPERM):
+                    # Kernel without pidfd support, fall back to plain polling
+                    log(f'pidfd exit watching unavailable, relying on polling: {e}', 'warning')
+                    self.use_pidfd = False
+                    return
+                log(f'Could not watch PID {pid} for exit, relying on polling: {e}', 'warning')
+                continue
+            self.exit_watchers[pid] = pidfd
+            self.loop.add_reader(pidfd, self.on_exit, pid)
+
+    def remove_exit_watcher(self, pid):
+        pidfd = self.exit_watchers.pop(pid, None)
+        if pidfd is not None:
+            self.loop.remove_reader(pidfd)
+            os.close(pidfd)
+
+    def on_exit(self, pid):
+        # A pidfd becomes readable once its process exits
+        self.remove_exit_watcher(pid)
+        self.wake_event.set()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.wake_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wake_event.clear()
+
+    def close(self):
+        for pid in list(self.exit_watchers):
+            self.remove_exit_watcher(pid)
+
+# Receives fork, exec and exit events from the kernel through the netlink proc connector,
+# so matches are updated the moment a process starts or ends without scanning /proc
+class ProcConnectorMonitor:
+    event_driven = True
+    instant_exits = True
+    # Starts are seen the moment they happen, so launchers don't need tracking
+    launchers = frozenset()
+
+    def __init__(self, match_proc, launcher_patterns=None):
+        self.match_proc = match_proc
+        self.target_patterns = {}
+        self.matches = {} # {pid: game}
+        self.loop = None
+        self.wake_event = asyncio.Event()
+        self.sock = open_proc_connector()
+        # Processes waiting to be matched. Reading /proc for them happens in a worker
+        # thread so a busy host running lots of short commands never stalls the loop
+        self.pending = set()
+        self.exited = set() # pids that exited while a batch was being evaluated
+        self.needs_rescan = False
+        self.eval_task = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.sock.fileno(), self.on_readable)
+
+    def set_patterns(self, target_patterns):
+        self.target_patterns = target_patterns
+        if self.loop is None:
+            self.matches = scan_matches(target_patterns=self.target_patterns, match_proc=self.match_proc)
+        else:
+            self.rescan()
+
+    def rescan(self):
+        self.needs_rescan = True
+        self.schedule_evaluation()
+
+    async def snapshot(self):
+        return dict(self.matches)
+
+    def on_readable(self):
+        with loop_stage('process events'):
+            self.read_events()
+
+    def read_events(self):
+        changed = False
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                # ENOBUFS means the kernel dropped events, so the only safe thing is a full rescan
+                log(f'Process event socket overflowed, rescanning processes: {e}', 'warning')
+                self.rescan()
+                return
+            for what, pid, parent in parse_proc_events(data):
+                changed |= self.handle_event(what, pid, parent)
+        if changed:
+            self.wake_event.set()
+        if self.pending:
+            self.schedule_evaluation()
+
+    # Only cheap bookkeeping happens here, anything that reads /proc is queued
+    def handle_event(self, what, pid, parent):
+        if what == PROC_EVENT_EXIT:
+            self.pending.discard(pid)
+            self.exited.add(pid)
+            return self.matches.pop(pid, None) is not None
+        if what == PROC_EVENT_FORK:
+            # A forked child runs the same program as its parent, so it matches the same game.
+            # This keeps parity with the poller, which also reports forked children
+            game = self.matches.get(parent)
+            if game is None:
+                return False
+            self.matches[pid] = game
+            return True
+        # exec and comm events can both change what a process matches
+        self.pending.add(pid)
+        return False
+
+    def schedule_evaluation(self):
+        if self.eval_task is None or self.eval_task.done():
+            self.eval_task = self.loop.create_task(self.evaluate_pending())
+
+    async def evaluate_pending(self):
+        while self.needs_rescan or self.pending:
+            self.exited = set()
+            if self.needs_rescan:
+                self.needs_rescan = False
+                self.pending = set()
+                try:
+                    results = await asyncio.to_thread(scan_matches, target_patterns=self.target_patterns, match_proc=self.match_proc)
+                except Exception as e:
+                    log(f'Error while rescanning processes: {e}', 'error')
+                    continue
+                self.matches = {pid: game for pid, game in results.items() if pid not in self.exited}
+                self.wake_event.set()
+                continue
+
+            pids, self.pending = self.pending, set()
+            try:
+                results = await asyncio.to_thread(self.evaluate_pids, pids)
+            except Exception as e:
+                log(f'Error while matching new processes: {e}', 'error')
+                continue
+            changed = False
+            for pid, game in results.items():
+                # The process ended while it was being evaluated
+                if pid in self.exited:
+                    continue
+                if game is None:
+                    changed |= self.matches.pop(pid, None) is not None
+                elif self.matches.get(pid) != game:
+                    self.matches[pid] = game
+                    changed = True
+            if changed:
+                self.wake_event.set()
+
+    # Runs in a worker thread. Returns {pid: game or None}
+    def evaluate_pids(self, pids):
+        results = {}
+        for pid in pids:
+            try:
+                proc = psutil.Process(pid)
+                proc.info = proc.as_dict(attrs=PROC_ATTRS)
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                results[pid] = None
+                continue
+            match_found, game = self.match_proc(target_patterns=self.target_patterns, proc=proc)
+            results[pid] = game if match_found else None
+        return results
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.wake_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wake_event.clear()
+
+    def close(self):
+        if self.eval_task is not None:
+            self.eval_task.cancel()
+        if self.loop is not None:
+            self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+def open_proc_connector():
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+    try:
+        sock.bind((os.getpid(), CN_IDX_PROC))
+        # Subscribing to process events, this needs CAP_NET_ADMIN on most kernels
+        payload = struct.pack('=I', PROC_CN_MCAST_LISTEN)
+        cn_msg = CN_MSG_HEADER.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(payload), 0) + payload
+        header = NLMSG_HEADER.pack(NLMSG_HEADER.size + len(cn_msg), NLMSG_DONE, 0, 0, os.getpid())
+        sock.send(header + cn_msg)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+# Yields (event, pid, parent pid) for the fork, exec, comm and exit events in a netlink
+# datagram. The parent pid is only set for fork events
+def parse_proc_events(data):
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        msg_len = NLMSG_HEADER.unpack_from(data, offset)[0]
+        if msg_len < NLMSG_HEADER.size:
+            return
+        event_offset = offset + NLMSG_HEADER.size + CN_MSG_HEADER.size
+        ids_offset = event_offset + PROC_EVENT_HEADER.size
+        if ids_offset + PROC_EVENT_IDS.size <= offset + msg_len:
+            what = PROC_EVENT_HEADER.unpack_from(data, event_offset)[0]
+            pid, tgid = PROC_EVENT_IDS.unpack_from(data, ids_offset)
+            if what == PROC_EVENT_FORK and ids_offset + 2 * PROC_EVENT_IDS.size <= offset + msg_len:
+                # Fork events carry the parent ids first and then the child ids
+                child_pid, child_tgid = PROC_EVENT_IDS.unpack_from(data, ids_offset + PROC_EVENT_IDS.size)
+                # New threads show up as forks too, only new processes matter
+                if child_pid == child_tgid:
+                    yield what, child_tgid, tgid
+            elif what in (PROC_EVENT_EXEC, PROC_EVENT_COMM):
+                yield what, tgid, None
+            # Only the thread group leader exiting means the process is gone
+            elif what == PROC_EVENT_EXIT and pid == tgid:
+                yield what, tgid, None
+        # Netlink messages are aligned to 4 bytes
+        offset += (msg_len + 3) & ~3
+
+def create_monitor(match_proc, launcher_patterns=None):
+    from settings import USE_PROCESS_EVENTS
+
+    if USE_PROCESS_EVENTS and get_platform() == 'linux':
+        try:
+            monitor = ProcConnectorMonitor(match_proc=match_proc, launcher_patterns=launcher_patterns)
+            log('Using kernel process events for process monitoring')
+            return monitor
+        except OSError as e:
+            log(f'Kernel process events unavailable ({e}), falling back to polling', 'warning')
+    log('Using polling for process monitoring')
+    return PollingMonitor(match_proc=match_proc, launcher_patterns=launcher_patterns)
+
+# Picks how long to wait between polls. Polls rarely when nothing is happening, quickly
+# right after a launcher appears, and backs off while a game runs if exits wake the loop anyway
+class PollScheduler:
+    def __init__(self):
+        from settings import POLL_INTERVAL
+
+        self.interval = POLL_INTERVAL
+        self.mode = None
+        self.boost_until = 0
+        self.seen_launchers = set()
+        # Scan cost stats, logged periodically
+        self.scan_count = 0
+        self.scan_total = 0
+        self.scan_max = 0
+        self.last_stats_log = time.monotonic()
+
+    def update(self, monitor, running_count, scan_seconds):
+        from settings import (POLL_INTERVAL, IDLE_POLL_INTERVAL, LAUNCHER_POLL_INTERVAL,
+                              LAUNCHER_BOOST_SECONDS, RUNNING_POLL_INTERVAL, SCAN_STATS_LOG_INTERVAL)
+
+        now = time.monotonic()
+        self.record_scan(scan_seconds)
+
+        new_launchers = monitor.launchers - self.seen_launchers
+        self.seen_launchers = set(monitor.launchers)
+        if new_launchers:
+            self.boost_until = now + LAUNCHER_BOOST_SECONDS
+
+        if monitor.event_driven:
+            # Kernel events wake the loop, polls are only a safety net
+            mode, interval = 'events', IDLE_POLL_INTERVAL
+        elif now < self.boost_until:
+            mode, interval = 'launcher started', LAUNCHER_POLL_INTERVAL
+        elif running_count:
+            if monitor.instant_exits:
+                # Exits wake the loop by themselves, so back off a little more each poll
+                base = self.interval if self.mode == 'game running' else POLL_INTERVAL
+                mode, interval = 'game running', min(base * 2, RUNNING_POLL_INTERVAL)
+            else:
+                # Polling is the only way to see the game exit
+                mode, interval = 'game running', POLL_INTERVAL
+        elif self.seen_launchers:
+            mode, interval = 'launcher running', POLL_INTERVAL
+        else:
+            mode, interval = 'idle', IDLE_POLL_INTERVAL
+
+        if mode != self.mode:
+            log(f'Poll interval {interval}s ({mode}), last scan took {scan_seconds * 1000:.1f} ms')
+        self.mode = mode
+        self.interval = interval
+
+        if now - self.last_stats_log >= SCAN_STATS_LOG_INTERVAL:
+            self.log_stats()
+            self.last_stats_log = now
+        return interval
+
+    def record_scan(self, scan_seconds):
+        self.scan_count += 1
+        self.scan_total += scan_seconds
+        self.scan_max = max(self.scan_max, scan_seconds)
+
+    def log_stats(self):
+        if not self.scan_count:
+            return
+        average = self.scan_total / self.scan_count * 1000
+        log(f'Process scans: {self.scan_count} in the last period, average {average:.1f} ms, '
+            f'max {self.scan_max * 1000:.1f} ms, current interval {self.interval}s ({self.mode})')
+        self.scan_count = 0
+        self.scan_total = 0
+        self.scan_max = 0
@@ -0,0 +1,43 @@
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from common import log
+
+# Read only view of the config and games the daemon is using. Handlers hold on to the
+# snapshot they were given, so a reload never changes data under a sync that is running
+Snapshot = namedtuple('Snapshot', ['config', 'games'])
+
+# Keeps the parsed config and games file in memory for the daemon. They are only read from
+# disk again when the file watchers report a change, instead of on every process event
+class DaemonRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = Snapshot(config=load_frozen_cfg(), games=load_frozen_games())
+
+    def reload_games(self):
+        games = load_frozen_games()
+        with self.lock:
+            self.snapshot = self.snapshot._replace(games=games)
+        log(f'Reloaded {len(games)} game entries')
+        return self.snapshot
+
+    def reload_config(self):
+        config = load_frozen_cfg()
+        with self.lock:
+            self.snapshot = self.snapshot._replace(config=config)
+        log('Reloaded configuration')
+        return self.snapshot
+
+def load_frozen_cfg():
+    from config import load_cfg
+
+    config = vars(load_cfg())
+    config['required_columns'] = MappingProxyType(config['required_columns'])
+    return namedtuple('Config', config)(**config)
+
+def load_frozen_games():
+    from files import get_games_file
+
+    games = get_games_file()
+    return MappingProxyType({game: MappingProxyType(data) for game, data in games.items()})
@@ -0,0 +1,186 @@
+import json
+import supabase
+from datetime import datetime, timedelta, timezone
+from rich import print
+from rich.prompt import Prompt
+
+from common import log
+
+# Uploads only ever add or overwrite files, so files deleted or renamed in a save folder stay
+# in the bucket, and every download fetches them again. This finds those orphans and deletes
+# them. A game's cloud files are only compared against its save folder while the two are
+# synced, since then the folder holds exactly the save the cloud has. Folders with no table
+# row are usually left over from a removal that didn't finish, but can also be a rename that
+# didn't finish or a first upload on another device, so they are returned apart and are only
+# ever deleted from the menu, one folder at a time. Files newer than REMOTE_GC_GRACE_HOURS
+# are never touched, they may belong to an upload still running on another device
+
+# Returns ({game: [(path, size)]} of orphans, {game: [(path, size)]} of folders with no table
+# row, {game: reason} of games that were skipped)
+def find_orphans(config, client, games, running_games=(), remote_state=None):
+    from settings import REMOTE_GC_GRACE_HOURS
+    from supabase_client import list_supabase_objects
+    from status import get_status
+    from files import iter_save_files
+    from common import get_platform
+    from remote_ops import load_pending_renames
+
+    response = client.table(config.table_name).select(config.required_columns['game_name']).execute()
+    cloud_games = {row[config.required_columns['game_name']] for row in response.data}
+
+    # {game: [(relative path, item)]}
+    objects_by_game = {}
+    for full_path, item in list_supabase_objects(config=config, client=client, folder=''):
+        game, _, relative_path = full_path.partition('/')
+        # Files at the top of the bucket weren't uploaded by this program
+        if not relative_path:
+            continue
+        objects_by_game.setdefault(game, []).append((relative_path, item))
+
+    # Both names of a rename that didn't finish hold part of the same save
+    renaming = {}
+    for new_name, old_name in load_pending_renames().items():
+        renaming[new_name] = renaming[old_name] = f'Rename from {old_name} to {new_name} has not finished'
+
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=REMOTE_GC_GRACE_HOURS)
+    platform = get_platform()
+    orphans = {}
+    unowned = {}
+    skipped = {}
+    for game, objects in objects_by_game.items():
+        if game in running_games:
+            skipped[game] = 'The game is running'
+            continue
+        if game in renaming:
+            skipped[game] = renaming[game]
+            continue
+        if game not in cloud_games:
+            if game in games:
+                skipped[game] = 'The game has never finished an upload'
+                continue
+            files = [(f'{game}/{relative_path}', item['metadata'].get('size', 0)) for relative_path, item in objects
+                     if is_past_grace(item, cutoff)]
+            if files:
+                unowned[game] = files
+            continue
+        elif game not in games:
+            # Another device's game, this one can't tell which of its files are current
+            skipped[game] = 'No local entry for this game'
+            continue
+        else:
+            status = get_status(config=config, client=client, games=games, game_choice=game, remote_state=remote_state)
+            if status['error']:
+                skipped[game] = status['error']
+                continue
+            if status['latest'] != 'synced':
+                skipped[game] = 'The local and cloud saves are not synced'
+                continue
+            # get_status registered the game's save rules, so this is the set that gets uploaded
+            local_path = games[game][f'{platform}_path']
+            local_files = {file.relative_to(local_path).as_posix() for file in iter_save_files(local_path)}
+
+        game_orphans = []
+        for relative_path, item in objects:
+            if relative_path in local_files or not is_past_grace(item, cutoff):
+                continue
+            game_orphans.append((f'{game}/{relative_path}', item['metadata'].get('size', 0)))
+        if game_orphans:
+            orphans[game] = game_orphans
+    return orphans, unowned, skipped
+
+def is_past_grace(item, cutoff):
+    updated_at = get_object_time(item)
+    return updated_at is not None and updated_at <= cutoff
+
+def get_object_time(item):
+    value = item.get('updated_at') or item.get('created_at')
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+# Returns the bytes reclaimed, or None if the cleanup couldn't run
+def collect_garbage(config, games=None, user_called=True, running_games=(), remote_state=None):
+    from common import internet_check, queue_notification
+    from connectivity import connectivity
+    from supabase_client import loop_supabase_validation
+    from remote_ops import remove_remote_files, print_failures
+    from files import is_json_valid
+    from trash_store import format_size
+    from settings import GAMES_FILE
+
+    if games is None:
+        if not is_json_valid(GAMES_FILE):
+            games = {}
+        else:
+            with open(GAMES_FILE, 'r') as f:
+                games = json.load(f)
+    if user_called and loop_supabase_validation(config=config) == -1:
+        return None
+
+    log('Looking for orphaned files in Supabase')
+    print('[blue]Looking for cloud files that are no longer part of a save...[/]')
+    try:
+        internet_check()
+        client = supabase.create_client(config.url, config.api_key)
+        orphans, unowned, skipped = find_orphans(config=config, client=client, games=games, running_games=running_games, remote_state=remote_state)
+    except Exception as e:
+        connectivity.report_error(e)
+        log(f'Error while looking for orphaned files in Supabase: {e}', 'error')
+        print(f'[red]ERROR: {e}[/]')
+        return None
+
+    for game, reason in skipped.items():
+        log(f'Skipped cloud cleanup for {game}: {reason}')
+        if user_called:
+            print(f'[yellow]Skipped {game}: {reason}[/]')
+    for game, files in unowned.items():
+        log(f'Cloud folder {game} has no table data, {len(files)} files, {format_size(sum(size for _, size in files))}')
+        if not user_called:
+            log(f'Skipped cloud cleanup for {game}: folders with no table data are only deleted from the menu')
+
+    for game, game_orphans in orphans.items():
+        log(f'Found {len(game_orphans)} orphaned files for {game}, {format_size(sum(size for _, size in game_orphans))}')
+        if user_called:
+            print(f'{game}: {len(game_orphans)} files, {format_size(sum(size for _, size in game_orphans))}')
+    paths = [path for game_orphans in orphans.values() for path, _ in game_orphans]
+    if paths and user_called:
+        total_size = sum(size for game_orphans in orphans.values() for _, size in game_orphans)
+        if not ask_yes_no(f"Delete {len(paths)} orphaned files ({format_size(total_size)}) from Supabase?"):
+            paths = []
+
+    # Each folder with no table data is confirmed on its own, it may be a save another device
+    # hasn't finished uploading or a rename made elsewhere
+    if user_called:
+        for game, files in unowned.items():
+            print(f'\n[yellow]The cloud folder [underline]{game}[/] has no table data: {len(files)} files, {format_size(sum(size for _, size in files))}[/]')
+            if ask_yes_no(f"Delete the whole folder {game} from Supabase?"):
+                paths.extend(path for path, _ in files)
+
+    if not paths:
+        log('No orphaned files deleted from Supabase')
+        print('[green]No orphaned files deleted[/]')
+        return 0
+
+    sizes = {path: size for files in (*orphans.values(), *unowned.values()) for path, size in files}
+    failures = remove_remote_files(config=config, client=client, paths=paths)
+    print_failures(failures=failures, action='delete')
+    failed_paths = {path for path, _ in failures}
+    reclaimed_bytes = sum(sizes[path] for path in paths if path not in failed_paths)
+    log(f'Deleted {len(paths) - len(failures)} orphaned files from Supabase, reclaiming {format_size(reclaimed_bytes)}')
+    print(f'\n[green]Deleted {len(paths) - len(failures)} orphaned files, reclaiming {format_size(reclaimed_bytes)}[/]')
+    if failures:
+        queue_notification(title='Error', message=f'Failed to delete {len(failures)} orphaned cloud files. Check logs for details')
+    return reclaimed_bytes
+
+def ask_yes_no(question):
+    choice = Prompt.ask(f"[yellow]{question} (y/n)[/]").strip().lower()
+    while True:
+        if choice == 'y':
+            return True
+        elif choice == 'n':
+            return False
+        else:
+            choice = Prompt.ask("Incorrect input. Please answer with 'y' or 'n'").strip().lower()
@@ -0,0 +1,115 @@
+import json
+import os
+from rich import print
+from rich.progress import Progress
+
+from common import log, bounded_map
+
+REMOVE_BATCH_SIZE = 1000 # Most objects the storage API deletes in one request
+
+# Bulk operations on files in the games bucket that run on the server, so renaming or
+# removing a game never downloads or uploads the files themselves. Requests run concurrently
+# up to MAX_REMOTE_THREADS, each file or batch can fail on its own and failures are returned
+# as [(path, error)] for the caller to report
+
+# pairs is [(source path, destination path)], operation is 'move' or 'copy'
+def transfer_remote_files(config, client, pairs, operation='move'):
+    from settings import MAX_REMOTE_THREADS
+    from connectivity import connectivity
+
+    bucket = client.storage.from_(config.games_bucket)
+    run = bucket.move if operation == 'move' else bucket.copy
+
+    def transfer(pair):
+        source, destination = pair
+        try:
+            run(source, destination)
+            return source, None
+        except Exception as e:
+            connectivity.report_error(e)
+            return source, str(e)
+
+    failures = []
+    with Progress() as progress:
+        task = progress.add_task(f"[cyan]{'Moving' if operation == 'move' else 'Copying'} files...", total=len(pairs))
+        for source, error in bounded_map(transfer, pairs, max_workers=MAX_REMOTE_THREADS):
+            if error:
+                log(f'Failed to {operation} {source}: {error}', 'error')
+                failures.append((source, error))
+            progress.advance(task)
+    log(f'{operation.capitalize()}d {len(pairs) - len(failures)} of {len(pairs)} files in Supabase')
+    return failures
+
+def remove_remote_files(config, client, paths):
+    from settings import MAX_REMOTE_THREADS
+    from connectivity import connectivity
+
+    bucket = client.storage.from_(config.games_bucket)
+    batches = [paths[start:start + REMOVE_BATCH_SIZE] for start in range(0, len(paths), REMOVE_BATCH_SIZE)]
+
+    def remove(batch):
+        try:
+            removed = {item.get('name') for item in bucket.remove(batch)}
+        except Exception as e:
+            connectivity.report_error(e)
+            return batch, [(path, str(e)) for path in batch]
+        # Objects missing from the response weren't deleted
+        return batch, [(path, 'Not deleted') for path in batch if path not in removed]
+
+    failures = []
+    with Progress() as progress:
+        task = progress.add_task("[cyan]Deleting files...", total=len(paths))
+        for batch, batch_failures in bounded_map(remove, batches, max_workers=MAX_REMOTE_THREADS):
+            for path, error in batch_failures:
+                log(f'Failed to delete {path}: {error}', 'error')
+            failures.extend(batch_failures)
+            progress.advance(task, len(batch))
+    log(f'Deleted {len(paths) - len(failures)} of {len(paths)} files in Supabase in {len(batches)} requests')
+    return failures
+
+# Renames whose cloud files haven't all been moved, as {new name: old name}. Until a rename
+# finishes, files sit under both names and the new folder has no table row yet, so cloud
+# cleanup must not take it for a removed game
+def load_pending_renames():
+    from settings import PENDING_RENAMES_FILE
+
+    if not os.path.exists(PENDING_RENAMES_FILE):
+        return {}
+    try:
+        with open(PENDING_RENAMES_FILE, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        log(f'Invalid pending renames file: {e}', 'warning')
+        return {}
+
+def save_pending_renames(renames):
+    from settings import PENDING_RENAMES_FILE
+
+    if not renames:
+        if os.path.exists(PENDING_RENAMES_FILE):
+            os.remove(PENDING_RENAMES_FILE)
+        return
+    # Writing to a temp file first so a crash never leaves a half written file
+    temp_path = f'{PENDING_RENAMES_FILE}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(renames, f, indent=4)
+    os.replace(temp_path, PENDING_RENAMES_FILE)
+
+def record_pending_rename(old_name, new_name):
+    renames = load_pending_renames()
+    renames[new_name] = old_name
+    save_pending_renames(renames)
+
+def finish_pending_rename(new_name):
+    renames = load_pending_renames()
+    if renames.pop(new_name, None) is not None:
+        save_pending_renames(renames)
+
+def print_failures(failures, action):
+    if not failures:
+        return
+    print(f'[red]Failed to {action} {len(failures)} files. Check logs for details[/]')
+    for path, error in failures[:5]:
+        print(f'[red]  {path}: {error}[/]')
+    if len(failures) > 5:
+        print(f'[red]  ...and {len(failures) - 5} more[/]')
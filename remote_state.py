@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import supabase
+
+from common import log
+
+# Local mirror of the supabase table. Only rows changed since the last seen
+# updated_at (the watermark) are fetched, so one small query keeps every game current.
+# updated_at is set by whichever device uploaded, so clocks can disagree. Each query reaches
+# REMOTE_WATERMARK_OVERLAP seconds back past the watermark so a device running behind isn't
+# missed, rows seen before are told apart by their hash. Launch and exit checks still fetch
+# their game's row directly with refresh_game instead of trusting the mirror
+class RemoteStateMirror:
+    def __init__(self, config, state_file=None):
+        from settings import REMOTE_STATE_FILE
+
+        self.config = config
+        self.state_file = state_file or REMOTE_STATE_FILE
+        self.rows = {} # {game_name: row}
+        self.watermark = None
+        # Hashes this machine uploaded itself, so they aren't reported as remote changes
+        self.own_hashes = {} # {game_name: hash}
+        # Games changed by other machines that the daemon hasn't been told about yet
+        self.pending_changes = []
+        # True once a full fetch succeeded, until then the mirror can't be trusted
+        self.ready = False
+        self.last_full_poll = 0
+        self.lock = threading.Lock()
+        self.client = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                data = json.load(f)
+            self.rows = data.get('rows', {})
+            self.watermark = data.get('watermark')
+            log(f'Loaded remote state for {len(self.rows)} games (watermark {self.watermark})')
+        except (json.JSONDecodeError, OSError) as e:
+            log(f'Invalid remote state file, starting fresh: {e}', 'warning')
+            self.rows = {}
+            self.watermark = None
+
+    def save(self):
+        # Writing to a temp file first so a crash never leaves a half written mirror
+        temp_file = f'{self.state_file}.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump({'watermark': self.watermark, 'rows': self.rows}, f, indent=4)
+        os.replace(temp_file, self.state_file)
+
+    # The next poll connects with the new config
+    def set_config(self, config):
+        with self.lock:
+            self.config = config
+            self.client = None
+
+    def get(self, game):
+        with self.lock:
+            row = self.rows.get(game)
+            return dict(row) if row else None
+
+    def note_own_upload(self, game, folder_hash):
+        with self.lock:
+            self.own_hashes[game] = folder_hash
+
+    # Stores a row this machine just wrote, the next poll fetches it again and moves the watermark
+    def record(self, row):
+        game = row[self.config.required_columns['game_name']]
+        with self.lock:
+            self.rows[game] = dict(row)
+            self.save()
+
+    # Returns and clears the games changed by other machines since the last call
+    def take_changes(self):
+        with self.lock:
+            changes = self.pending_changes
+            self.pending_changes = []
+            return changes
+
+    def advance_watermark(self, row):
+        updated_at = row.get(self.config.required_columns['updated_at'])
+        if not updated_at:
+            return
+        if self.watermark is None or datetime.fromisoformat(updated_at) > datetime.fromisoformat(self.watermark):
+            self.watermark = updated_at
+
+    # Fetches the game's row directly and stores it, returns the row or None if it has none.
+    # Raises on errors
+    def refresh_game(self, game):
+        columns = self.config.required_columns
+
+        if self.client is None:
+            self.client = supabase.create_client(self.config.url, self.config.api_key)
+        response = self.client.table(self.config.table_name).select(
+            columns['game_name'], columns['hash'], columns['last_modified'], columns['updated_at']
+        ).eq(columns['game_name'], game).execute()
+        row = response.data[0] if response.data else None
+        with self.lock:
+            if row is None:
+                self.rows.pop(game, None)
+            else:
+                self.rows[game] = row
+            self.save()
+        return dict(row) if row else None
+
+    # Fetches rows changed since the watermark. Games changed by another machine are
+    # queued for take_changes()
+    def poll(self, full=False):
+        from settings import REMOTE_FULL_POLL_INTERVAL, REMOTE_WATERMARK_OVERLAP
+
+        columns = self.config.required_columns
+
+        if self.client is None:
+            self.client = supabase.create_client(self.config.url, self.config.api_key)
+
+        # The watermark feed can't see deleted or renamed rows, so a full fetch is done
+        # on the first poll and then periodically to drop them
+        full = full or not self.ready or time.time() - self.last_full_poll >= REMOTE_FULL_POLL_INTERVAL
+        query = self.client.table(self.config.table_name).select(
+            columns['game_name'], columns['hash'], columns['last_modified'], columns['updated_at']
+        )
+        if not full and self.watermark:
+            since = datetime.fromisoformat(self.watermark) - timedelta(seconds=REMOTE_WATERMARK_OVERLAP)
+            query = query.gte(columns['updated_at'], since.isoformat())
+        response = query.order(columns['updated_at']).execute()
+
+        changed = []
+        new_rows = 0
+        with self.lock:
+            old_rows = dict(self.rows)
+            if full:
+                self.rows = {}
+                self.last_full_poll = time.time()
+            for row in response.data:
+                game = row[columns['game_name']]
+                self.rows[game] = row
+                self.advance_watermark(row)
+
+                # Rows inside the overlap come back on every poll until the watermark moves on
+                old_row = old_rows.get(game)
+                if old_row is not None and old_row.get(columns['hash']) == row[columns['hash']]:
+                    if old_row.get(columns['updated_at']) != row[columns['updated_at']]:
+                        new_rows += 1
+                    continue
+                new_rows += 1
+                if self.own_hashes.get(game) == row[columns['hash']]:
+                    continue
+                changed.append(game)
+            self.pending_changes.extend(game for game in changed if game not in self.pending_changes)
+
+            if full or new_rows:
+                self.save()
+            self.ready = True
+
+        if full:
+            log(f'Fetched remote state for {len(self.rows)} games')
+        elif new_rows:
+            log(f'Fetched {new_rows} remote changes, watermark now {self.watermark}')
@@ -0,0 +1,123 @@
+import os
+import re
+import threading
+
+from common import get_platform
+
+# Which files in a save folder take part in syncing. A game entry can have gitignore style
+# "include" and "exclude" lists in games.json:
+#   *.sav        a file or folder with that name at any depth
+#   saves/*.sav  a path relative to the save folder
+#   cache/       a trailing slash only matches folders
+#   **           any number of folders
+# Excluded folders are skipped without being walked. With include patterns only files that
+# match one, or sit in a folder that does, are synced. SKIP_EXTENSIONS applies either way
+class SaveRules:
+    def __init__(self, include=(), exclude=()):
+        from settings import SKIP_EXTENSIONS
+
+        flags = re.IGNORECASE if get_platform() == "windows" else 0
+        self.include = [compile_pattern(pattern, flags) for pattern in include if is_pattern(pattern)]
+        self.exclude = [compile_pattern(pattern, flags) for pattern in exclude if is_pattern(pattern)]
+        self.skip_extensions = {extension.lower() for extension in SKIP_EXTENSIONS}
+
+    # Whether the rules leave out anything beyond SKIP_EXTENSIONS
+    def has_patterns(self):
+        return bool(self.include or self.exclude)
+
+    # relative_dir is a posix path relative to the save folder
+    def prunes_dir(self, relative_dir):
+        return any(pattern.fullmatch(relative_dir) for pattern, _ in self.exclude)
+
+    # Checks the file itself, its folders are expected to have passed prunes_dir already
+    def includes_file(self, relative_path):
+        if os.path.splitext(relative_path)[1].lower() in self.skip_extensions:
+            return False
+        if any(pattern.fullmatch(relative_path) for pattern, dir_only in self.exclude if not dir_only):
+            return False
+        if not self.include:
+            return True
+        # A file is included if it matches or one of its folders does
+        parts = relative_path.split('/')
+        for depth in range(len(parts), 0, -1):
+            candidate = '/'.join(parts[:depth])
+            is_dir = depth < len(parts)
+            if any(pattern.fullmatch(candidate) for pattern, dir_only in self.include if is_dir or not dir_only):
+                return True
+        return False
+
+    # Checks the file along with every folder it sits in, for paths that didn't come from a walk
+    def includes(self, relative_path):
+        parts = relative_path.split('/')
+        for depth in range(1, len(parts)):
+            if self.prunes_dir('/'.join(parts[:depth])):
+                return False
+        return self.includes_file(relative_path)
+
+def is_pattern(pattern):
+    pattern = pattern.strip()
+    return bool(pattern) and not pattern.startswith('#')
+
+# Returns (compiled regex matching a relative posix path, whether it only matches folders)
+def compile_pattern(pattern, flags=0):
+    pattern = pattern.strip().replace('\\', '/')
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    # A pattern with a slash is relative to the save folder, otherwise it matches at any depth
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex = ''
+    position = 0
+    while position < len(pattern):
+        if pattern.startswith('**/', position):
+            regex += '(?:.*/)?'
+            position += 3
+        elif pattern.startswith('**', position):
+            regex += '.*'
+            position += 2
+        elif pattern[position] == '*':
+            regex += '[^/]*'
+            position += 1
+        elif pattern[position] == '?':
+            regex += '[^/]'
+            position += 1
+        else:
+            regex += re.escape(pattern[position])
+            position += 1
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    return re.compile(regex, flags), dir_only
+
+# Rules are compiled once per distinct include/exclude lists and looked up by save folder,
+# so the code walking a folder doesn't need to know which game it belongs to
+compiled_rules = {} # {(include, exclude): SaveRules}
+rules_by_path = {} # {absolute save folder: SaveRules}
+rules_lock = threading.Lock()
+
+def set_save_rules(path, game_data):
+    include = tuple(game_data.get('include') or ())
+    exclude = tuple(game_data.get('exclude') or ())
+    with rules_lock:
+        rules = compiled_rules.get((include, exclude))
+        if rules is None:
+            rules = compiled_rules[(include, exclude)] = SaveRules(include=include, exclude=exclude)
+        rules_by_path[os.path.abspath(path)] = rules
+    return rules
+
+# For a folder that stands in for a save folder, like one about to be moved to the trash
+def copy_save_rules(path, source_path):
+    rules = get_save_rules(source_path)
+    with rules_lock:
+        rules_by_path[os.path.abspath(path)] = rules
+
+def get_save_rules(path):
+    key = os.path.abspath(path)
+    with rules_lock:
+        rules = rules_by_path.get(key)
+        if rules is None:
+            # Folders of games without patterns, and snapshots that only hold synced files
+            rules = compiled_rules.get(((), ()))
+            if rules is None:
+                rules = compiled_rules[((), ())] = SaveRules()
+        return rules
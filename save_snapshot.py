@@ -0,0 +1,143 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from common import log, get_platform
+
+FICLONE = 0x40049409 # Linux ioctl that makes dst share src's blocks until either is written
+
+# A point-in-time copy of a save folder to upload from, so a game writing while the upload
+# runs can't mix old and new files or make the hash disagree with what was uploaded. It sits
+# next to the save folder so files can be frozen without copying them: reflinks where the
+# filesystem has them (btrfs, XFS), otherwise hardlinks, otherwise a plain copy.
+# A hardlink still shares the file, which is fine for games that save by writing a new file
+# and renaming it over the old one. Files written in place are caught by changed_files and
+# copied with copy_files
+class SaveSnapshot:
+    def __init__(self, source_path):
+        self.source_path = Path(source_path)
+        self.path = None
+        self.linked = {} # {relative path: (size, mtime_ns)} of hardlinked files when frozen
+        self.method = 'reflink' if get_platform() == "linux" else 'hardlink'
+
+    # Files can only be linked within one filesystem, so the snapshot goes in the first writable
+    # folder on the save folder's device: next to the save folder, then the trash folder. If
+    # neither works it's a full copy in the temp folder
+    def choose_location(self):
+        from settings import TRASH_FOLDER
+
+        # Only next to the save folder is the folder name enough to tell games apart
+        path_id = hashlib.md5(str(self.source_path.absolute()).encode()).hexdigest()[:8]
+        candidates = [
+            self.source_path.parent / f'.{self.source_path.name}.upload',
+            Path(TRASH_FOLDER).absolute() / f'.{self.source_path.name}.{path_id}.upload'
+        ]
+        source_device = self.source_path.stat().st_dev
+        for candidate in candidates:
+            try:
+                candidate.parent.mkdir(exist_ok=True)
+                if candidate.parent.stat().st_dev != source_device:
+                    continue
+                self.make_folder(candidate)
+                return candidate
+            except OSError as e:
+                log(f'Cannot take a snapshot of {self.source_path} in {candidate.parent}: {e}')
+        candidate = Path(tempfile.gettempdir()) / f'.{self.source_path.name}.{path_id}.upload'
+        self.make_folder(candidate)
+        log(f'No writable folder on the same drive as {self.source_path}, its snapshot is a full copy in {candidate.parent}', 'warning')
+        self.method = 'copy'
+        return candidate
+
+    def make_folder(self, path):
+        # Left over from an upload that never finished
+        if path.exists():
+            shutil.rmtree(path)
+        path.mkdir(parents=True)
+
+    def create(self):
+        from files import iter_save_files
+        from manifest import seed_manifest
+
+        self.path = self.choose_location()
+        file_count = 0
+        for file in iter_save_files(self.source_path):
+            relative_path = file.relative_to(self.source_path)
+            destination_path = self.path / relative_path
+            destination_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                self.freeze_file(file, destination_path, relative_path.as_posix())
+            except FileNotFoundError:
+                # Deleted since the folder was listed, so it isn't part of the snapshot
+                continue
+            file_count += 1
+        # Frozen files keep their size and mtime, so the save folder's hashes still apply
+        seed_manifest(self.path, self.source_path)
+        log(f'Snapshot of {self.source_path} taken with {self.method} for {file_count} files')
+
+    def freeze_file(self, file, destination_path, relative_path):
+        if self.method == 'reflink':
+            try:
+                reflink_file(file, destination_path)
+                return
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    raise
+                destination_path.unlink(missing_ok=True)
+                log(f'Reflinks are not supported for {self.source_path}, using hardlinks: {e}')
+                self.method = 'hardlink'
+        if self.method == 'hardlink':
+            try:
+                os.link(file, destination_path)
+                stat = destination_path.stat()
+                self.linked[relative_path] = (stat.st_size, stat.st_mtime_ns)
+                return
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    raise
+                log(f'Hardlinks are not supported for {self.source_path}, copying: {e}')
+                self.method = 'copy'
+        shutil.copy2(file, destination_path)
+
+    # Replaces hardlinked files with copies, so files the game writes in place are frozen
+    def copy_files(self, relative_paths):
+        for relative_path in relative_paths:
+            self.linked.pop(relative_path, None)
+            destination_path = self.path / relative_path
+            temp_path = destination_path.with_name(f'{destination_path.name}.copy')
+            try:
+                shutil.copy2(self.source_path / relative_path, temp_path)
+            except FileNotFoundError:
+                # Deleted from the save folder, the link holds the last version written
+                continue
+            os.replace(temp_path, destination_path)
+        log(f'Copied {len(relative_paths)} files written in place into the snapshot of {self.source_path}')
+
+    # Hardlinked files the game wrote to in place since the snapshot was taken
+    def changed_files(self):
+        changed = []
+        for relative_path, stats in self.linked.items():
+            try:
+                stat = (self.path / relative_path).stat()
+            except FileNotFoundError:
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != stats:
+                changed.append(relative_path)
+        return changed
+
+    def remove(self):
+        from manifest import forget_manifest
+
+        if self.path is None:
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
+        forget_manifest(self.path)
+
+def reflink_file(source_file, destination_file):
+    import fcntl
+
+    with open(source_file, 'rb') as source, open(destination_file, 'wb') as destination:
+        fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+    shutil.copystat(source_file, destination_file)
@@ -13,23 +13,56 @@ GAMES_FILE = 'games.json'
 SKIP_EXTENSIONS = ['.tmp'] # Files with these extensions will be skipped during uploads e.g ['.tmp', '.log']
 MAX_DOWNLOAD_THREADS = 2 # Higher = faster downloads but higher chance for failiure
 MAX_UPLOAD_THREADS = 1 # Higher max_threads = faster uploads but higher chance for failiure
+MAX_REMOTE_THREADS = 8 # Parallel move/delete requests when renaming or removing a game, files stay in Supabase so these are cheap
+SNAPSHOT_BEFORE_UPLOAD = True # Whether uploads read from a snapshot of the save folder, so a game writing during the upload can't mix old and new files
 TRASH_FOLDER = 'Trash' # Folder to store deleted save files in
 
 SKIP_GAMES = [] # Games with these names will be ignored by auto.py e.g ['Cuphead', 'Wolfenstein']
 APP_NAME = 'Cloud Saves' # App name that shows up in notifications
 ICON_PATH = os.path.join(os.path.dirname(__file__), "Cloud_Saves.png") # Icon that shows up in notifications
 POLL_INTERVAL = 2 # How many seconds between each check of running processes if auto.py running
+IDLE_POLL_INTERVAL = 10 # Seconds between process checks when no game or launcher is running
+LAUNCHER_POLL_INTERVAL = 0.5 # Seconds between process checks right after a game launcher starts
+LAUNCHER_BOOST_SECONDS = 120 # How long to keep polling quickly after a game launcher starts
+RUNNING_POLL_INTERVAL = 15 # Longest wait between process checks while a game runs (only used when exits are detected instantly)
+LAUNCHER_PROCESSES = ['steam', 'lutris', 'heroic', 'EpicGamesLauncher', 'GalaxyClient', 'Playnite', 'legendary', 'bottles'] # Process names that count as game launchers
+SCAN_STATS_LOG_INTERVAL = 300 # Seconds between log entries summarising process scan cost
+LOOP_LAG_CHECK_INTERVAL = 0.5 # Seconds between checks of how responsive auto.py's event loop is
+LOOP_LAG_THRESHOLD = 0.25 # auto.py logs a warning when its event loop was blocked for longer than this many seconds
+USE_PROCESS_EVENTS = True # Whether auto.py listens for kernel process events on Linux instead of polling (needs CAP_NET_ADMIN, falls back to polling)
 RECORD_PLAYTIME = True # Whether to record game playtime when auto.py is running (records in hours)
+PLAYTIME_FILE = 'playtime.jsonl' # Journal auto.py appends play sessions to
+PLAYTIME_COMPACT_LINES = 500 # auto.py merges the playtime journal into one line per game once it has more lines than this
+LIVE_SYNC = True # Whether auto.py uploads changed save files in the background while a game runs
+LIVE_SYNC_DEBOUNCE = 30 # Seconds a save folder must stay unchanged before live sync uploads it
+THROTTLE_SYNC_WHILE_GAMING = True # Whether auto.py lowers the CPU and disk priority of syncs and caps their bandwidth while a game is running
+SYNC_BANDWIDTH_LIMIT = 2048 # KB/s syncs may use while a game is running (0 for no cap)
+PREFETCH_CLOUD_SAVES = True # Whether auto.py downloads a newer cloud save while the game runs and swaps it in when the game closes
+REMOTE_POLL_INTERVAL = 30 # How many seconds between each check for cloud saves uploaded by other devices if auto.py running
+REMOTE_FULL_POLL_INTERVAL = 600 # How many seconds between full refreshes of the cloud save state, which pick up deleted or renamed games
+REMOTE_WATERMARK_OVERLAP = 300 # How many seconds each check for cloud changes reaches back, covers devices whose clocks run behind this one
+REMOTE_STATE_FILE = 'remote_state.json' # File auto.py uses to mirror the cloud save state locally
+REMOTE_GC_INTERVAL_HOURS = 0 # How many hours between cleanups of cloud files no longer part of any save if auto.py running, also run at startup. 0 means never
+REMOTE_GC_GRACE_HOURS = 24 # Cloud files changed within this many hours are never cleaned up, so uploads running on other devices are left alone
+SYNC_WORKERS = 2 # How many saves auto.py syncs at the same time
+SYNC_MAX_ATTEMPTS = 5 # How many times auto.py tries to sync a save before giving up
+SYNC_RETRY_DELAY = 30 # Seconds before the first retry of a failed sync, doubled after each attempt
+SYNC_QUEUE_FILE = 'sync_queue.json' # File auto.py keeps pending syncs in so they survive a restart
+PENDING_RENAMES_FILE = 'pending_renames.json' # Game renames whose cloud files haven't all been moved yet, cloud cleanup leaves them alone
 
 LOG_FILE_NAME = 'cloud_saves.log' # Log file name generated by auto.py
 LOG_FOLDER = 'Logs' # Folder to store logs in, keep empty if you want logs to be in working directory
 MAX_LOG_BYTES = 5 * 1024 * 1024 # A new log file will be created once the current one reaches this file size (default 5 MB)
 LOG_BACKUP_COUNT = 3 # How many old log files to keep
 MAX_BACKUPS = 5 # Maximum number of save file backups to keep in the trash folder
+MAX_BACKUP_MB = 0 # Maximum total size of a game's backups in MB, older backups past it are deleted. 0 means no limit
+MAX_BACKUP_AGE_DAYS = 0 # Backups older than this many days are deleted. 0 means no limit
+DEDUPLICATE_TRASH = True # Whether files identical across backups are stored once and hardlinked
 
 CLEAR_TRASH = True # Whether to clear trash on each run of auto.py if MAX_BACKUPS is exceeded
 SEND_NOTIFICATIONS = True # Whether auto.py sends notifications for important events
 SOUND_ON_NOTIFICATION = True # Whether to play sound with notifications on Linux
 NOTIFICATION_SOUND_PATH = 'Sound/notification.ogg' # Path to notification sound file
+NOTIFICATION_COALESCE_WINDOW = 1 # Seconds to gather notifications before sending, a burst within it is combined into fewer notifications
 
 
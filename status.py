@@ -46,9 +46,10 @@ def check_save_status(config):
         case 'return':
             return
         
-def get_status(config, client, games, game_choice):
-    from files import hash_save_folder, get_last_modified
+def get_status(config, client, games, game_choice, remote_state=None):
+    from files import hash_for_comparison, get_last_modified
     from common import get_platform, log
+    from save_rules import set_save_rules
 
     log(f'Checking sync status for {game_choice}')
     
@@ -61,15 +62,20 @@ def get_status(config, client, games, game_choice):
             'game': game_choice,
             'error': 'The save directory provided for this game is invalid'
         }
+    set_save_rules(folder, games[game_choice])
     folder = Path(folder)
-        
-    response = (
-        client.table(config.table_name)
-        .select('*')
-        .eq(config.required_columns['game_name'], game_choice)
-        .execute()
-    )
-    data = response.data[0] if response.data else None
+
+    # The daemon's remote mirror already knows the cloud state, so no query is needed
+    if remote_state is not None and remote_state.ready:
+        data = remote_state.get(game_choice)
+    else:
+        response = (
+            client.table(config.table_name)
+            .select('*')
+            .eq(config.required_columns['game_name'], game_choice)
+            .execute()
+        )
+        data = response.data[0] if response.data else None
 
     if not data:
         updated_at = None
@@ -83,7 +89,7 @@ def get_status(config, client, games, game_choice):
 
     lm = get_last_modified(folder=Path(games[game_choice][f"{platform}_path"]))
     local_last_modified = datetime.fromisoformat(lm) if lm else None
-    local_hash = hash_save_folder(path=Path(games[game_choice][f"{platform}_path"]))
+    local_hash = hash_for_comparison(path=Path(games[game_choice][f"{platform}_path"]), cloud_hash=cloud_hash)
 
     if cloud_last_modified is None and local_last_modified is None:
         latest = None
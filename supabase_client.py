@@ -4,15 +4,18 @@ from pathlib import Path
 from rich import print
 from rich.prompt import Prompt
 from rich.progress import Progress
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
 import supabase
 import time
 import json
 
+LIST_PAGE_SIZE = 1000 # Most items the storage API lists in one request
+SNAPSHOT_REUPLOAD_ATTEMPTS = 3 # Rounds of uploading files a game wrote to in place during an upload
+
 # Returns True if everthing is valid. Returns False and updates info if anything was invalid
 # Returns -1 if unexpected error
 def supabase_validation(config):
-    from common import log, internet_check, is_auto_mode, send_notification
+    from common import log, internet_check, is_auto_mode, queue_notification
     from config import edit_supabase_info
     from settings import CONFIG_FILE
     
@@ -48,14 +51,14 @@ def supabase_validation(config):
 
         if missing_columns:
             print(f"[yellow]The column(s) [underline]{str(missing_columns)}[/] are missing from your supabase table[/]")
-            send_notification(title='Error', message=f"The column(s) {str(missing_columns)} are missing from your supabase table")
+            queue_notification(title='Error', message=f"The column(s) {str(missing_columns)} are missing from your supabase table")
             log(f"The column(s) {str(missing_columns)} are missing from your supabase table", 'error')
             return -1
         
         for column in required_columns_list:
             if actual_types[column] != expected_types[column]:
                 print(f"[yellow]Column '{column}' has wrong type: expected '{expected_types[column]}', got '{actual_types[column]}'[/]")
-                send_notification(title='Error', message=f"Column(s) in your supabase table have the wrong type. Check the log file for more details")
+                queue_notification(title='Error', message=f"Column(s) in your supabase table have the wrong type. Check the log file for more details")
                 log(f"Column '{column}' has wrong type: expected '{expected_types[column]}', got '{actual_types[column]}'", 'error')
                 return -1
 
@@ -70,7 +73,7 @@ def supabase_validation(config):
                 log(f'Successfully created bucket: {config.games_bucket}')
             except Exception as e:
                 log(f'Could not create supabase bucket: {e}', 'error')
-                send_notification(title='Error', message='Could not create supabase bucket, check logs for details')
+                queue_notification(title='Error', message='Could not create supabase bucket, check logs for details')
                 print(f'[yellow]Supabase storage bucket {config.games_bucket} does not exist. [/]'\
                         f'[yellow]The program encountered this error when trying to create it: {e}[/]')
                 return -1
@@ -83,7 +86,7 @@ def supabase_validation(config):
         details = str(getattr(e, "details", "").lower())
 
         if e_str == 'invalid url':
-            send_notification(title='Error', message=f'The supabase data api url in {CONFIG_FILE} is incorrect')
+            queue_notification(title='Error', message=f'The supabase data api url in {CONFIG_FILE} is incorrect')
             log(f'The supabase data api url in {CONFIG_FILE} is incorrect', 'error')
             if not is_auto_mode():
                 print(f'[yellow]The Supabase data api url in your {CONFIG_FILE} is incorrect. You will be repeatedly prompted to update it until you enter it correctly[/]')
@@ -92,7 +95,7 @@ def supabase_validation(config):
             else:
                 return -1
         elif e_str == 'invalid compact jws' or e_str == 'jws protected header is invalid' or 'invalid api key' in details:
-            send_notification(title='Error', message=f'The supabase service role api key in {CONFIG_FILE} is incorrect')
+            queue_notification(title='Error', message=f'The supabase service role api key in {CONFIG_FILE} is incorrect')
             log(f'The supabase service role api key in {CONFIG_FILE} is incorrect', 'error')
             if not is_auto_mode():
                 print(f'[yellow]The Supabase service_role api key in your {CONFIG_FILE} is incorrect. You will be repeatedly prompted to update it until you enter it correctly[/]')
@@ -101,7 +104,7 @@ def supabase_validation(config):
             else: 
                 return -1
         elif 'relation' in e_str and 'does not exist' in e_str:
-            send_notification(title='Error', message=f'The supabase table name in {CONFIG_FILE} is incorrect')
+            queue_notification(title='Error', message=f'The supabase table name in {CONFIG_FILE} is incorrect')
             log(f'The supabase table name in {CONFIG_FILE} is incorrect', 'error')
             if not is_auto_mode():
                 print(f'[yellow]The Supabase table name in your {CONFIG_FILE} is incorrect as a table with this name does not exist. You will be repeatedly prompted to update it until you enter it correctly[/]') 
@@ -110,7 +113,7 @@ def supabase_validation(config):
             else:
                 return -1
         else:
-            send_notification(title='Error', message='An unexpected error occured while trying to validate supabase. Check logs for details')
+            queue_notification(title='Error', message='An unexpected error occured while trying to validate supabase. Check logs for details')
             log(f'Unexpected error when trying to validate supabase: {e}', 'error')
             print(f"[red]ERROR:[/] {e}")
             return -1
@@ -127,29 +130,42 @@ def loop_supabase_validation(config):
         if valid:
             return valid   
 
-def upload_file(config, client, entry, file_path, local_path, retries=3):
+# digests collects {relative path: (manifest entry, ns)} of each file as it is sent, so the
+# folder can be hashed afterwards without reading the files again
+def upload_file(config, client, entry, file_path, local_path, retries=3, digests=None):
     from common import log
+    from throttle import sync_throttle
+    from connectivity import connectivity
+    from manifest import HashingReader
     
     # Makes full path into relative path 
     relative_path = file_path.relative_to(local_path)
     upload_path = f"{entry}/{relative_path}".replace('\\', '/')
 
+    # Holds the upload back while a game is running in auto mode
+    try:
+        sync_throttle.throttle(file_path.stat().st_size)
+    except OSError:
+        pass
+
     # Checking if file already exists in Supabase, if yes then use
     # update() otherwise use .upload()
     attempt = 0
     while attempt < retries:
         try:
             # Works if not first time uploading
-            with open(file_path, 'rb') as f:
+            with HashingReader(file_path) as f:
                 client.storage.from_(config.games_bucket).update(upload_path, f)
+                record_digest(digests, relative_path, f)
                 return file_path, None
         except Exception as e:
             winerr = getattr(e, 'winerror', None)
             # Means this is the first time uploading
             if "Not found" in str(e) or "404" in str(e):
                 try:
-                    with open(file_path, 'rb') as f2:
+                    with HashingReader(file_path) as f2:
                         client.storage.from_(config.games_bucket).upload(upload_path, f2)
+                        record_digest(digests, relative_path, f2)
                         return file_path, None
                 except Exception as e2:
                     # Need same error checking  in both cases
@@ -159,6 +175,7 @@ def upload_file(config, client, entry, file_path, local_path, retries=3):
                         attempt += 1
                         continue
                     log(f'Failed to upload file {relative_path}: {e2}', 'error')
+                    connectivity.report_error(e2)
                     return file_path, str(e2)
             # Need same error checking  in both cases
             elif winerr == 10035:
@@ -167,15 +184,23 @@ def upload_file(config, client, entry, file_path, local_path, retries=3):
                 continue
             else:
                 log(f'Failed to upload file {relative_path}: {e}', 'error')
+                connectivity.report_error(e)
                 return  file_path, str(e)
     log(f'Failed to upload file {relative_path} after {retries} retries', 'error')
     return file_path, "WinError 10035: Failed after retries"
 
-def upload_save(config, games=None, entry=None, user_called=True, validate_supabase=True):
-    from settings import SKIP_EXTENSIONS
-    from common import log, get_platform, send_notification
+def record_digest(digests, relative_path, reader):
+    entry = reader.entry()
+    if digests is not None and entry is not None:
+        digests[relative_path.as_posix()] = (entry, reader.opened_at_ns)
+
+# skip_unchanged is {relative path: (size, mtime_ns)} of files already uploaded, e.g. by the
+# daemon's live sync. Files whose stats still match are not uploaded again.
+# only_files is a set of relative paths, when given every other file is known to match the cloud
+def upload_save(config, games=None, entry=None, user_called=True, validate_supabase=True, remote_state=None, skip_unchanged=None, only_files=None):
+    from common import log, get_platform, queue_notification
     from game_entry import take_entry_input
-    from files import hash_save_folder, get_last_modified
+    from save_rules import set_save_rules
     
     log(f'Starting upload for {entry}', 'info')
     
@@ -198,61 +223,152 @@ def upload_save(config, games=None, entry=None, user_called=True, validate_supab
     # Need to check for empty "" path entry too as that still forms a valid path to the current directory
     if not local_path or not os.path.exists(local_path):
         log(f'The save directory for {entry} is invalid: {games[entry][f"{operating_sys}_path"]}', 'error')
-        send_notification(title='Error', message=f'The save direcotry for {entry} is invalid. Check logs for details')
+        queue_notification(title='Error', message=f'The save direcotry for {entry} is invalid. Check logs for details')
         print('\n[yellow]The save directory provided for this game is invalid[/]')
         return False
+    set_save_rules(local_path, games[entry])
     local_path = Path(local_path)
-    files_to_upload = [f for f in local_path.rglob('*') if f.is_file() and f.suffix.lower() not in SKIP_EXTENSIONS]
-    if not files_to_upload:
+    snapshot = take_upload_snapshot(local_path=local_path)
+    try:
+        return upload_save_folder(config=config, client=client, entry=entry, local_path=local_path, snapshot=snapshot,
+                                  remote_state=remote_state, skip_unchanged=skip_unchanged, only_files=only_files)
+    finally:
+        if snapshot is not None:
+            snapshot.remove()
+
+# Freezes the save folder so the upload and its hash see the same files, returns None if it
+# can't be taken and the upload reads the save folder directly
+def take_upload_snapshot(local_path):
+    from common import log
+    from settings import SNAPSHOT_BEFORE_UPLOAD
+    from save_snapshot import SaveSnapshot
+
+    if not SNAPSHOT_BEFORE_UPLOAD:
+        return None
+    snapshot = SaveSnapshot(local_path)
+    try:
+        snapshot.create()
+        return snapshot
+    except OSError as e:
+        log(f'Could not take a snapshot of {local_path}, uploading from the save folder: {e}', 'warning')
+        snapshot.remove()
+        return None
+
+# Uploads from the snapshot if there is one. Paths are relative to whichever folder is read
+def upload_save_folder(config, client, entry, local_path, snapshot=None, remote_state=None, skip_unchanged=None, only_files=None):
+    from common import log, queue_notification, bounded_map
+    from files import hash_save_folder, get_last_modified, iter_save_files
+    from manifest import get_manifest
+
+    source_path = snapshot.path if snapshot is not None else local_path
+    save_files = iter_save_files(source_path)
+    first_file = next(save_files, None)
+    if first_file is None:
         log(f'The save directory for {entry} contains no files', 'warning')
         print('\n[yellow]The save directory for this game contains no files[/]')
         return False
-    
-    log(f'Found {len(files_to_upload)} files to upload for {entry}')
-    
+
+    counts = {'found': 0, 'matching': 0, 'skipped': 0}
+
+    # Files are fed to the uploads as the folder is walked, so no list of every file is built
+    def files_to_upload():
+        for file in chain([first_file], save_files):
+            counts['found'] += 1
+            relative_path = file.relative_to(source_path).as_posix()
+            if only_files is not None and relative_path not in only_files:
+                counts['matching'] += 1
+                continue
+            if skip_unchanged:
+                stat = file.stat()
+                if skip_unchanged.get(relative_path) == (stat.st_size, stat.st_mtime_ns):
+                    counts['skipped'] += 1
+                    continue
+            yield file
+        # The walk is done, so the progress bar's total is known now
+        progress.update(task, total=counts['found'] - counts['matching'] - counts['skipped'])
+
     # Initialising progress bar
     with Progress() as progress:
         from settings import MAX_UPLOAD_THREADS
-        task = progress.add_task("[cyan]Uploading files...", total=len(files_to_upload))
+        task = progress.add_task("[cyan]Uploading files...", total=None)
+        digests = {}
+
         # How many threads to create, tune as needed
         # Higher max_threads = faster uploads but higher chance for failiure
-        max_workers = min(MAX_UPLOAD_THREADS, len(files_to_upload)) 
-        
-        # Submit all upload to the thread pool
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [
-                executor.submit(upload_file, config, client, entry, file_path, local_path)
-                for file_path in files_to_upload
-            ]
-        
-            # As each file finishes, handle progress and errors
-            error_count = 0
-            for future in as_completed(futures):
-                filename, error = future.result()
-                if error:
-                    log(f'Error uploading {filename} for {entry}: {error}', 'error')
-                    print(f"[red]Error uploading {filename}: {error}[/]")
-                    error_count += 1
-                progress.advance(task)
+        results = bounded_map(
+            lambda file_path: upload_file(config, client, entry, file_path, source_path, digests=digests),
+            files_to_upload(),
+            max_workers=MAX_UPLOAD_THREADS
+        )
+        # As each file finishes, handle progress and errors
+        error_count = 0
+        for filename, error in results:
+            if error:
+                log(f'Error uploading {filename} for {entry}: {error}', 'error')
+                print(f"[red]Error uploading {filename}: {error}[/]")
+                error_count += 1
+            progress.advance(task)
+
+    if only_files is not None:
+        log(f'Uploaded changed files for {entry}, the other {counts["matching"]} match the cloud')
+    if skip_unchanged:
+        log(f'Skipped {counts["skipped"]} files for {entry} that were already uploaded')
+    log(f'Uploaded {counts["found"] - counts["matching"] - counts["skipped"]} of {counts["found"]} files for {entry}')
 
     if error_count > 0:
         log(f'Upload completed with {error_count} errors for {entry}', 'warning')
     else:
         log(f'Successfully uploaded all files for {entry}')
 
-    folder_hash = hash_save_folder(path=local_path)
-    last_modified = get_last_modified(folder=Path(local_path))
+    # A hardlinked file written in place during the upload may have been uploaded half written.
+    # Those are copied into the snapshot, which freezes them, and uploaded again, so the row
+    # written below describes exactly what the bucket holds
+    if snapshot is not None:
+        for _ in range(SNAPSHOT_REUPLOAD_ATTEMPTS):
+            changed = snapshot.changed_files()
+            if not changed:
+                break
+            log(f'{len(changed)} files of {entry} were written to during the upload, uploading them again: {changed}', 'warning')
+            snapshot.copy_files(changed)
+            changed_paths = [source_path / relative_path for relative_path in changed if (source_path / relative_path).exists()]
+            for filename, error in bounded_map(
+                lambda file_path: upload_file(config, client, entry, file_path, source_path, digests=digests),
+                changed_paths,
+                max_workers=MAX_UPLOAD_THREADS
+            ):
+                if error:
+                    log(f'Error uploading {filename} for {entry}: {error}', 'error')
+                    print(f"[red]Error uploading {filename}: {error}[/]")
+                    error_count += 1
+        if snapshot.changed_files():
+            log(f'Files of {entry} kept changing during the upload, the table data was not updated', 'warning')
+            print(f'\n[yellow]Save files of {entry} changed during the upload, upload it again once the game is closed[/]')
+            return False
+
+    # The files were hashed while they were sent, so hashing the folder only reads files the
+    # manifest knows nothing about. The save folder's manifest learns them too, the snapshot's
+    # files have the same stats
+    get_manifest(source_path).record_entries(digests)
+    if snapshot is not None:
+        get_manifest(local_path).record_entries(digests)
+    folder_hash = hash_save_folder(path=source_path)
+    last_modified = get_last_modified(folder=source_path)
     row = {
         config.required_columns['game_name']: entry,
         config.required_columns['hash']: folder_hash,
         config.required_columns['last_modified']: last_modified,
         config.required_columns['updated_at']: datetime.now(timezone.utc).isoformat()
     }
+    # Letting the daemon's remote mirror know this change is ours
+    if remote_state is not None:
+        remote_state.note_own_upload(entry, folder_hash)
     try:
         client.table(config.table_name).upsert(row).execute()
         log(f'Updated table data for {entry}')
+        if remote_state is not None:
+            remote_state.record(row)
     except Exception as e:
-        send_notification(title='Error', message=f'Failed to update table data for {entry}. Check logs for details')
+        queue_notification(title='Error', message=f'Failed to update table data for {entry}. Check logs for details')
         log(f'Failed to update table data for {entry}: {e}', 'error')
         print(f"[red]Failed to update table data for {entry}: {e}[/]")
 
@@ -261,6 +377,8 @@ def upload_save(config, games=None, entry=None, user_called=True, validate_supab
 
 def download_file(config, client, entry, file_path, source_path, retries=3):
     from common import log
+    from throttle import sync_throttle
+    from connectivity import connectivity
     
     relative_path = Path(file_path.replace(f"{entry}/", "", 1))
     destination_path = source_path / relative_path
@@ -269,6 +387,8 @@ def download_file(config, client, entry, file_path, source_path, retries=3):
     while attempt < retries:
         try:
             downloaded_file = client.storage.from_(config.games_bucket).download(file_path)
+            # The size is only known afterwards, so this paces the next download instead
+            sync_throttle.throttle(len(downloaded_file))
             
             # Making sure destination folders exist
             destination_path.parent.mkdir(parents=True, exist_ok=True)
@@ -286,14 +406,18 @@ def download_file(config, client, entry, file_path, source_path, retries=3):
             return relative_path.name, str(e)
         except Exception as e:
             log(f'Failed to download file {relative_path.name}: {e}', 'error')
+            connectivity.report_error(e)
             return relative_path.name, str(e)
     log(f'Failed to download file {relative_path.name} after {retries} retries', 'error')
     return relative_path.name, 'WinError 10035: Failed after retries'
 
 def download_save(config, games=None, entry=None, user_called=True, validate_supabase=True):
-    from common import log, internet_check, get_platform, send_notification
+    from common import log, internet_check, get_platform, queue_notification, bounded_map
     from game_entry import take_entry_input
-    from files import hash_save_folder, move_files
+    from files import hash_for_comparison, backup_save
+    from manifest import get_manifest
+    from trash_store import add_backup
+    from save_rules import set_save_rules
     
     internet_check()
     log(f'Starting download for {entry}', 'info')
@@ -310,9 +434,10 @@ def download_save(config, games=None, entry=None, user_called=True, validate_sup
     source_path = games[entry][f"{operating_sys}_path"]
     if not source_path or not os.path.exists(source_path):
         log(f'The save directory for {entry} is invalid: {games[entry][f"{operating_sys}_path"]}', 'error')
-        send_notification(title='Error', message=f'The save direcotry for {entry} is invalid. Check logs for details')
+        queue_notification(title='Error', message=f'The save direcotry for {entry} is invalid. Check logs for details')
         print('[yellow]The save directory provided for this game is invalid[/]')
         return False
+    set_save_rules(source_path, games[entry])
     source_path = Path(source_path)
 
     if validate_supabase:
@@ -324,20 +449,20 @@ def download_save(config, games=None, entry=None, user_called=True, validate_sup
     response = client.table(config.table_name).select("*").eq(config.required_columns['game_name'], entry).execute()
     row = response.data[0] if response.data else None
     if row is None:
-        send_notification(title='Error', message=f'No table data found for {entry}')
+        queue_notification(title='Error', message=f'No table data found for {entry}')
         log(f'No table data found for {entry}', 'error')
         print(f'[yellow]No table data exists for the game {entry}[/]')
         return False
     
     file_list = client.storage.from_(config.games_bucket).list(f"{entry}/")
     if not file_list:
-        send_notification(title='Error', message=f'No cloud data found for {entry}')
+        queue_notification(title='Error', message=f'No cloud data found for {entry}')
         log(f'No cloud data found for {entry}', 'error')
         print(f'[yellow]No cloud data exists for the game {entry}[/]')
         return False
     
-    source_hash = hash_save_folder(path=source_path)
     cloud_hash = row[config.required_columns['hash']]
+    source_hash = hash_for_comparison(path=source_path, cloud_hash=cloud_hash)
 
     if source_hash == cloud_hash:
         choice = Prompt.ask(f"[yellow]Your local and cloud save files are currently the same. Do you still want to continue? (y/n)[/]").strip().lower()
@@ -363,32 +488,33 @@ def download_save(config, games=None, entry=None, user_called=True, validate_sup
     
     log(f'Found {len(files_to_download)} files to download for {entry}')
     
-    move_files(source_path=source_path, backup_path=backup_path)
+    # The manifest's hashes let the backup be deduplicated without reading the save again
+    known_entries = get_manifest(source_path).trusted_entries()
+    backup_save(source_path=source_path, backup_path=backup_path)
+    add_backup(backup_path=backup_path, known_entries=known_entries)
 
     log(f'Downloading files for {entry}')
     with Progress() as progress:
         from settings import MAX_DOWNLOAD_THREADS
         task = progress.add_task("[cyan]Downloading files...", total=len(files_to_download))
-        max_workers = min(MAX_DOWNLOAD_THREADS, len(files_to_download)) 
-
-        # Submit all downloads to the thread pool
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [
-                executor.submit(download_file, config, client, entry, file_path, source_path)
-                for file_path in files_to_download
-            ]
-        
-            # As each file finishes, handle progress and errors
-            error_count = 0
-            for future in as_completed(futures):
-                filename, error = future.result()
-                if error:
-                    extra_message = "Try reducing MAX_DOWNLOAD_THREADS" if "blocking" in error.lower() else ""
-                    send_notification(title='Error', message=f'Error downloading {filename} for {entry}. Check logs for details')
-                    log(f'Error downloading {filename} for {entry}: {error}. {extra_message}', 'error')
-                    print(f"[yellow]Error downloading {filename}: {error}. {extra_message}[/]")
-                    error_count += 1
-                progress.advance(task)
+
+        # Only a few downloads are submitted ahead of the ones running
+        results = bounded_map(
+            lambda file_path: download_file(config, client, entry, file_path, source_path),
+            files_to_download,
+            max_workers=MAX_DOWNLOAD_THREADS
+        )
+        # As each file finishes, handle progress and errors
+        error_count = 0
+        for filename, error in results:
+            if error:
+                extra_message = "Try reducing MAX_DOWNLOAD_THREADS" if "blocking" in error.lower() else ""
+                queue_notification(title='Error', message=f'Error downloading {filename} for {entry}. Check logs for details',
+                                   group=f'download {entry}', summary=f'Error downloading {{count}} files for {entry}. Check logs for details')
+                log(f'Error downloading {filename} for {entry}: {error}. {extra_message}', 'error')
+                print(f"[yellow]Error downloading {filename}: {error}. {extra_message}[/]")
+                error_count += 1
+            progress.advance(task)
 
     if error_count > 0:
         log(f'Download completed with {error_count} errors for {entry}', 'warning')
@@ -466,45 +592,56 @@ def sync_save(config):
         case 'return':
             return
 
+# Returns False if any file couldn't be deleted
 def remove_supabase_files(config, client, entry_name_to_del):
     from common import internet_check
+    from remote_ops import remove_remote_files, print_failures
     
     files_to_delete = list_all_supabase_files(config=config, client=client, folder=f"{entry_name_to_del}/")
     if files_to_delete == -1:
-        return
+        return False
     if files_to_delete:
         internet_check()
-        try:
-            client.storage.from_(config.games_bucket).remove(files_to_delete)
-        except Exception as e:
-            print(f"[red]ERROR: {e}[/]")
+        failures = remove_remote_files(config=config, client=client, paths=files_to_delete)
+        print_failures(failures=failures, action='delete')
+        return not failures
+    return True
 
 # Returns -1 if error
 def list_all_supabase_files(config, client, folder):
-    from common import log, internet_check, send_notification
+    from common import log, internet_check, queue_notification
+    from connectivity import connectivity
     
     try:
         internet_check()
-        full_file_paths = []
-
-        items = client.storage.from_(config.games_bucket).list(folder)
-
-        for item in items:
-            name = item["name"]
-            full_path = f"{folder}{name}"
-
-            # Check if item is a folder
-            if not item["metadata"]:
-                # Recursive call into subfolder
-                subfiles = list_all_supabase_files(config=config, client=client, folder=f"{full_path}/")
-                full_file_paths.extend(subfiles)
-            else:
-                full_file_paths.append(full_path)
-        
+        full_file_paths = [full_path for full_path, _ in list_supabase_objects(config=config, client=client, folder=folder)]
         log(f'Found {len(full_file_paths)} files in Supabase folder: {folder}')
         return full_file_paths
     except Exception as e:
-        send_notification(title='Error', message='An error occured while retrieving data from supabase. Check logs for details')
+        connectivity.report_error(e)
+        queue_notification(title='Error', message='An error occured while retrieving data from supabase. Check logs for details')
         log(f'Error while retrieving files from supabase: {e}', 'error')
         print(f"[red]ERROR: {e}[/]")
-        return -1
\ No newline at end of file
+        return -1
+
+# Returns [(full path, item)] for every file under folder, where item is the API's listing entry
+# with the file's metadata. Raises on errors
+def list_supabase_objects(config, client, folder):
+    bucket = client.storage.from_(config.games_bucket)
+    items = []
+    # The API returns 100 items by default, so larger folders are listed in pages
+    while True:
+        page = bucket.list(folder, {'limit': LIST_PAGE_SIZE, 'offset': len(items)})
+        items.extend(page)
+        if len(page) < LIST_PAGE_SIZE:
+            break
+
+    objects = []
+    for item in items:
+        full_path = f"{folder}{item['name']}"
+        # Folders have no metadata
+        if not item["metadata"]:
+            objects.extend(list_supabase_objects(config=config, client=client, folder=f"{full_path}/"))
+        else:
+            objects.append((full_path, item))
+    return objects
\ No newline at end of file
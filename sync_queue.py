@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from common import log, queue_notification
+
+# Exit syncs waiting to run, saved to disk so they survive a daemon restart. A limited number
+# of workers run them, the most recently played game first. A game only ever has one job
+# waiting, later exits replace it. Failed jobs are retried with a growing delay.
+# While offline nothing runs, so every session played offline adds up to one sync per game
+# that is flushed together once the connection is back
+class SyncQueue:
+    def __init__(self, run_job, drop_extras=None, queue_file=None, workers=None):
+        from settings import SYNC_QUEUE_FILE, SYNC_WORKERS
+
+        # run_job(job, extras) is awaited for each job and returns True once the save is synced
+        self.run_job = run_job
+        # drop_extras(extras) releases the extras of a job that was replaced before it ran
+        self.drop_extras = drop_extras
+        self.queue_file = queue_file or SYNC_QUEUE_FILE
+        self.worker_count = workers or SYNC_WORKERS
+        self.jobs = {} # {game: job} waiting to run
+        self.running = {} # {game: job} being run by a worker
+        # Objects that only live in this process, like a running live sync. Not saved to disk
+        self.extras = {} # {game: dict}
+        # One per worker, so every idle worker sees a new job instead of the first to wake
+        # clearing a shared event under the others
+        self.wake_events = []
+        self.workers = []
+        self.offline = False
+        # Saves are written in worker threads, the version keeps an older write from landing last
+        self.save_lock = threading.Lock()
+        self.save_version = 0
+        self.written_version = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.queue_file):
+            return
+        try:
+            with open(self.queue_file, 'r') as f:
+                saved_jobs = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            log(f'Invalid sync queue file, starting empty: {e}', 'warning')
+            return
+        # A job that was running when the daemon stopped is saved next to the one waiting
+        # after it, the later exit wins
+        for job in sorted(saved_jobs, key=lambda job: job['exited_at']):
+            job['next_try'] = 0
+            self.jobs[job['game']] = job
+        if self.jobs:
+            log(f'Loaded {len(self.jobs)} pending syncs: {list(self.jobs)}')
+
+    # Copies the jobs on the loop and writes them from a worker thread
+    def save(self):
+        self.save_version += 1
+        jobs = [dict(job) for job in (*self.running.values(), *self.jobs.values())]
+        return asyncio.get_running_loop().run_in_executor(None, self.write, jobs, self.save_version)
+
+    def write(self, jobs, version):
+        with self.save_lock:
+            if version < self.written_version:
+                return
+            try:
+                # Writing to a temp file first so a crash never leaves a half written queue
+                temp_file = f'{self.queue_file}.tmp'
+                with open(temp_file, 'w') as f:
+                    json.dump(jobs, f, indent=4)
+                os.replace(temp_file, self.queue_file)
+                self.written_version = version
+            except OSError as e:
+                log(f'Failed to save sync queue: {e}', 'error')
+
+    # baseline is {relative path: md5} of the save when the session started, see on_process_exit
+    def add(self, game, latest, extras=None, baseline=None):
+        old_job = self.jobs.get(game)
+        if old_job is not None:
+            log(f'Replacing pending sync for {game}')
+            old_extras = self.extras.pop(game, None)
+            if old_extras and self.drop_extras is not None:
+                self.drop_extras(old_extras)
+            # The first unsynced session's baseline covers the changes of every later one
+            if old_job.get('baseline') is not None:
+                baseline = old_job['baseline']
+        self.jobs[game] = {
+            'game': game,
+            'latest': latest,
+            'exited_at': time.time(),
+            'attempts': 0,
+            'next_try': 0,
+            'baseline': baseline
+        }
+        self.extras[game] = extras or {}
+        self.save()
+        self.wake()
+        log(f'Queued sync for {game} ({len(self.jobs)} waiting, {len(self.running)} running)')
+
+    def __len__(self):
+        return len(self.jobs) + len(self.running)
+
+    # Returns the most recently played job that is due, along with the seconds until the next
+    # one is due if none are
+    def take_ready(self):
+        now = time.time()
+        # A game's next job waits until its running one is done
+        waiting = [job for game, job in self.jobs.items() if game not in self.running]
+        ready = [job for job in waiting if job['next_try'] <= now]
+        if not ready:
+            wait = min((job['next_try'] - now for job in waiting), default=None)
+            return None, wait
+        job = max(ready, key=lambda job: job['exited_at'])
+        del self.jobs[job['game']]
+        self.running[job['game']] = job
+        return job, None
+
+    def wake(self):
+        for event in self.wake_events:
+            event.set()
+
+    def start(self):
+        self.wake_events = [asyncio.Event() for _ in range(self.worker_count)]
+        self.workers = [asyncio.create_task(self.worker(event)) for event in self.wake_events]
+        log(f'Started {self.worker_count} sync workers')
+        # Running anything left over from the last run
+        self.wake()
+
+    async def worker(self, wake_event):
+        from connectivity import connectivity
+
+        while True:
+            if connectivity.online is False:
+                self.offline = True
+                await connectivity.wait_online()
+                if self.offline:
+                    self.offline = False
+                    log(f'Back online, flushing {len(self.jobs)} queued syncs: {list(self.jobs)}')
+            job, wait = self.take_ready()
+            if job is None:
+                wake_event.clear()
+                try:
+                    await asyncio.wait_for(wake_event.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            game = job['game']
+            # Extras are only handed to the first attempt, a live sync can't be stopped twice
+            extras = self.extras.pop(game, None) or {}
+            try:
+                success = await self.run_job(job, extras)
+            except Exception as e:
+                log(f'Unexpected error while syncing {game}: {e}', 'error')
+                success = False
+            finally:
+                del self.running[game]
+
+            if not success:
+                # Syncs that failed because the connection dropped wait for it instead of counting
+                # as an attempt
+                if connectivity.online is False and game not in self.jobs:
+                    self.jobs[game] = job
+                else:
+                    self.retry(job)
+            await self.save()
+            # Another job may have been waiting on this game
+            self.wake()
+
+    def retry(self, job):
+        from settings import SYNC_MAX_ATTEMPTS, SYNC_RETRY_DELAY
+
+        game = job['game']
+        job['attempts'] += 1
+        # A newer exit replaced this job while it ran
+        if game in self.jobs:
+            return
+        if job['attempts'] >= SYNC_MAX_ATTEMPTS:
+            queue_notification(title='Error', message=f'Gave up syncing {game} after {job["attempts"]} attempts')
+            log(f'Gave up syncing {game} after {job["attempts"]} attempts', 'error')
+            return
+        delay = SYNC_RETRY_DELAY * 2 ** (job['attempts'] - 1)
+        job['next_try'] = time.time() + delay
+        self.jobs[game] = job
+        log(f'Retrying sync for {game} in {delay}s (attempt {job["attempts"] + 1} of {SYNC_MAX_ATTEMPTS})', 'warning')
+
+    # Stops the workers, jobs that were running stay in the queue file for the next start
+    async def close(self):
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.wake_events = []
@@ -0,0 +1,49 @@
+import threading
+import time
+
+from common import log, lower_thread_priority
+
+# Slows sync transfers down while a watched game is running, so a sync of one game doesn't
+# compete with another game for disk and network. The daemon reports whether a game is
+# running, threads moving files lower their own priority and are paced to
+# SYNC_BANDWIDTH_LIMIT. Once nothing is running new transfers go at full speed again
+class SyncThrottle:
+    def __init__(self):
+        self.gaming = False
+        self.lock = threading.Lock()
+        self.next_free = 0 # When the bytes already let through are used up at the capped rate
+        self.lowered = threading.local()
+
+    def set_gaming(self, gaming):
+        if gaming == self.gaming:
+            return
+        self.gaming = gaming
+        if gaming:
+            log('A game is running, throttling sync transfers')
+        else:
+            log('No game is running, sync transfers are no longer throttled')
+
+    # Called by a transfer thread before it moves nbytes
+    def throttle(self, nbytes):
+        from settings import THROTTLE_SYNC_WHILE_GAMING, SYNC_BANDWIDTH_LIMIT
+
+        if not THROTTLE_SYNC_WHILE_GAMING or not self.gaming:
+            return
+        # A lowered priority can't be raised again without privileges, so only threads that
+        # end with the transfer are lowered. Upload and download workers are started per sync
+        if not getattr(self.lowered, 'done', False):
+            lower_thread_priority()
+            self.lowered.done = True
+        if not SYNC_BANDWIDTH_LIMIT:
+            return
+
+        rate = SYNC_BANDWIDTH_LIMIT * 1024
+        with self.lock:
+            now = time.monotonic()
+            # Waiting until the transfers before this one have had their share of the bandwidth
+            delay = max(self.next_free - now, 0)
+            self.next_free = max(self.next_free, now) + nbytes / rate
+        if delay:
+            time.sleep(delay)
+
+sync_throttle = SyncThrottle()
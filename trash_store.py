@@ -0,0 +1,318 @@
+import json
+import os
+import shutil
+import stat
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from common import log
+
+STORE_FOLDER = '.store' # Inside the trash folder, next to the game folders
+WRITE_BITS = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+# Backups in the trash keep their full folder tree, but every file is a hardlink into a
+# content-addressed store at Trash/.store/<md5[:2]>/<md5>_<mtime_ns>. Identical files across
+# backups take up space once. The mtime is part of the name so a linked file keeps its own
+# mtime. Objects are read-only, a linked file is shared by every backup that has it, so
+# writing to one in place (a backup restored by moving it) fails instead of changing them
+# all. An object whose only link left is the store's own belongs to no backup anymore and is
+# pruned. The size of each backup is kept in an index, which retention by size reads
+# instead of walking the backups
+
+# Adds a new backup to the size index, replacing files that are already in the store with
+# links to it and adding the rest. known_entries is {relative path: (size, mtime_ns, md5)} from
+# the save folder's manifest, files whose stats still match aren't read again
+def add_backup(backup_path:Path, known_entries=None):
+    from settings import DEDUPLICATE_TRASH
+    from manifest import hash_file
+
+    store_path = backup_path.parent.parent / STORE_FOLDER
+    known_entries = known_entries or {}
+    dedupe = DEDUPLICATE_TRASH
+    total_bytes = 0
+    linked_count = 0
+    saved_bytes = 0
+    for folder, _, file_names in os.walk(backup_path):
+        for file_name in file_names:
+            file = Path(folder) / file_name
+            if file.is_symlink():
+                continue
+            file_stat = file.stat()
+            total_bytes += file_stat.st_size
+            if not dedupe:
+                continue
+            try:
+                entry = known_entries.get(file.relative_to(backup_path).as_posix())
+                if entry is not None and entry[:2] == (file_stat.st_size, file_stat.st_mtime_ns):
+                    md5 = entry[2]
+                else:
+                    md5 = hash_file(file)
+                object_path = store_path / md5[:2] / f'{md5}_{file_stat.st_mtime_ns}'
+                if not object_path.exists():
+                    object_path.parent.mkdir(parents=True, exist_ok=True)
+                    os.link(file, object_path)
+                    make_read_only(object_path)
+                    continue
+                object_stat = object_path.stat()
+                if object_stat.st_ino == file_stat.st_ino or object_stat.st_size != file_stat.st_size:
+                    continue
+                # Linking next to the file first so the file is never missing
+                temp_path = file.with_name(f'{file_name}.link')
+                os.link(object_path, temp_path)
+                os.replace(temp_path, file)
+                linked_count += 1
+                saved_bytes += file_stat.st_size
+            except OSError as e:
+                # Filesystems like FAT have no hardlinks, the rest of the backup stays a full copy
+                log(f'Could not deduplicate backup {backup_path}: {e}', 'warning')
+                dedupe = False
+
+    record_backup_size(backup_path=backup_path, size=total_bytes)
+    if DEDUPLICATE_TRASH:
+        log(f'Deduplicated {linked_count} files of backup {backup_path}, saving {format_size(saved_bytes)}')
+
+# The size index at Trash/.index.json is {game: {backup name: bytes}}, so retention by size
+# doesn't have to walk every backup. Sizes are what the backup would take without the store
+INDEX_FILE = '.index.json'
+index_lock = threading.Lock()
+
+def load_trash_index(trash_folder):
+    index_path = Path(trash_folder) / INDEX_FILE
+    if not index_path.exists():
+        return {}
+    try:
+        with open(index_path, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        log(f'Invalid trash index, backup sizes will be measured again: {e}', 'warning')
+        return {}
+
+def save_trash_index(trash_folder, index):
+    index_path = Path(trash_folder) / INDEX_FILE
+    # Writing to a temp file first so a crash never leaves a half written index
+    temp_path = index_path.with_name(f'{INDEX_FILE}.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(index, f, indent=4)
+    os.replace(temp_path, index_path)
+
+def record_backup_size(backup_path:Path, size):
+    trash_folder = backup_path.parent.parent
+    with index_lock:
+        index = load_trash_index(trash_folder)
+        index.setdefault(backup_path.parent.name, {})[backup_path.name] = size
+        save_trash_index(trash_folder, index)
+
+# Returns {backup name: bytes} for the given backups of a game. Backups made before the index
+# existed are measured once, entries of backups that are gone are dropped
+def get_backup_sizes(trash_folder, game, backup_names):
+    with index_lock:
+        index = load_trash_index(trash_folder)
+        indexed = index.get(game, {})
+        sizes = {}
+        for name in backup_names:
+            if name in indexed:
+                sizes[name] = indexed[name]
+            else:
+                sizes[name] = get_folder_size(Path(trash_folder) / game / name)
+        if sizes != indexed:
+            if sizes:
+                index[game] = sizes
+            else:
+                index.pop(game, None)
+            save_trash_index(trash_folder, index)
+        return sizes
+
+def forget_backups(trash_folder, game, backup_names):
+    with index_lock:
+        index = load_trash_index(trash_folder)
+        for name in backup_names:
+            index.get(game, {}).pop(name, None)
+        if not index.get(game):
+            index.pop(game, None)
+        save_trash_index(trash_folder, index)
+
+def get_folder_size(path):
+    size = 0
+    for folder, _, file_names in os.walk(path):
+        for file_name in file_names:
+            file = os.path.join(folder, file_name)
+            if not os.path.islink(file):
+                size += os.path.getsize(file)
+    return size
+
+# Returns the backups to delete, given backup names newest first. A backup is kept while it is
+# within max_backups, MAX_BACKUP_AGE_DAYS and, counting the newer backups kept, MAX_BACKUP_MB.
+# Once the size budget is used up every older backup goes. The newest is kept regardless of
+# size and age so a game always has one backup
+def select_excess_backups(backup_names, sizes, max_backups):
+    from settings import MAX_BACKUP_MB, MAX_BACKUP_AGE_DAYS
+
+    now = datetime.now()
+    kept_bytes = 0
+    over_budget = False
+    excess = []
+    for position, name in enumerate(backup_names):
+        if position >= max_backups:
+            excess.append(name)
+            continue
+        if position == 0:
+            kept_bytes += sizes[name]
+            continue
+        if MAX_BACKUP_MB and kept_bytes + sizes[name] > MAX_BACKUP_MB * 1024 * 1024:
+            over_budget = True
+        age = get_backup_age(name, now)
+        if over_budget or (MAX_BACKUP_AGE_DAYS and age is not None and age > timedelta(days=MAX_BACKUP_AGE_DAYS)):
+            excess.append(name)
+            continue
+        kept_bytes += sizes[name]
+    return excess
+
+# Backups are named after the time they were made, same format as download_save uses
+def get_backup_age(name, now):
+    try:
+        return now - datetime.strptime(name, "%Y-%m-%d_%H-%M-%S")
+    except ValueError:
+        return None
+
+# Deletes backups on a background thread. A backup is first renamed into Trash/.deleting,
+# which is instant, so it is gone from the trash right away. The thread exits once there is
+# nothing left, so a CLI run still finishes deleting before it exits. Anything a killed
+# process left in .deleting is picked up by the next cleanup
+DELETING_FOLDER = '.deleting'
+
+class TrashCleaner:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = [] # [(path, trash folder)]
+        self.worker = None
+
+    def delete(self, path:Path, trash_folder):
+        deleting_path = Path(trash_folder) / DELETING_FOLDER
+        deleting_path.mkdir(exist_ok=True)
+        target = deleting_path / f'{path.parent.name}_{path.name}_{time.time_ns()}'
+        os.rename(path, target)
+        self.queue(target, trash_folder)
+
+    # Queues whatever an earlier run didn't finish deleting
+    def resume(self, trash_folder):
+        deleting_path = Path(trash_folder) / DELETING_FOLDER
+        if not deleting_path.exists():
+            return
+        for target in deleting_path.iterdir():
+            self.queue(target, trash_folder)
+
+    def queue(self, target, trash_folder):
+        with self.lock:
+            if any(queued == target for queued, _ in self.pending):
+                return
+            self.pending.append((target, trash_folder))
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='trash-cleaner')
+                self.worker.start()
+
+    def run(self):
+        from common import lower_thread_priority
+
+        lower_thread_priority()
+        trash_folders = set() # Trash folders with deletions since the store was last pruned
+        while True:
+            with self.lock:
+                if self.pending:
+                    target, trash_folder = self.pending.pop(0)
+                elif trash_folders:
+                    target = None
+                    prune_folders, trash_folders = trash_folders, set()
+                else:
+                    self.worker = None
+                    break
+            if target is None:
+                # Files of the deleted backups that no other backup shares
+                for prune_folder in prune_folders:
+                    prune_store(prune_folder)
+                continue
+            trash_folders.add(str(trash_folder))
+            try:
+                delete_tree(target)
+            except FileNotFoundError:
+                # Queued again by resume while it was being deleted
+                pass
+            except OSError as e:
+                log(f'Error deleting backup {target}: {e}', 'error')
+
+trash_cleaner = TrashCleaner()
+
+def make_read_only(path):
+    mode = os.stat(path).st_mode
+    if mode & WRITE_BITS:
+        os.chmod(path, stat.S_IMODE(mode) & ~WRITE_BITS)
+
+# Windows can't delete read-only files, so they are made writable first. That also makes the
+# store object writable, prune_store makes it read-only again
+def delete_tree(path):
+    def make_writable(function, failed_path, _):
+        os.chmod(failed_path, stat.S_IWRITE | stat.S_IREAD)
+        function(failed_path)
+    # onerror was renamed to onexc in 3.12
+    if sys.version_info >= (3, 12):
+        shutil.rmtree(path, onexc=make_writable)
+    else:
+        shutil.rmtree(path, onerror=make_writable)
+
+def delete_file(path):
+    try:
+        os.unlink(path)
+    except PermissionError:
+        os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+        os.unlink(path)
+
+# Deletes objects no backup links to anymore, returns the bytes freed. Objects still in use
+# are made read-only again, including ones stored before objects were read-only
+def prune_store(trash_folder):
+    store_path = Path(trash_folder) / STORE_FOLDER
+    if not store_path.exists():
+        return 0
+    freed_bytes = 0
+    pruned_count = 0
+    for folder in store_path.iterdir():
+        if not folder.is_dir():
+            continue
+        for object_path in folder.iterdir():
+            object_stat = object_path.stat()
+            if object_stat.st_nlink > 1:
+                if object_stat.st_mode & WRITE_BITS:
+                    make_read_only(object_path)
+                continue
+            delete_file(object_path)
+            freed_bytes += object_stat.st_size
+            pruned_count += 1
+        if not any(folder.iterdir()):
+            folder.rmdir()
+    if pruned_count:
+        log(f'Pruned {pruned_count} unused files from the trash store, freeing {format_size(freed_bytes)}')
+    return freed_bytes
+
+# Returns how many bytes deduplication saves across all backups. An object with n links is
+# used by n - 1 backups but stored once
+def get_store_savings(trash_folder):
+    store_path = Path(trash_folder) / STORE_FOLDER
+    if not store_path.exists():
+        return 0
+    saved_bytes = 0
+    for folder in store_path.iterdir():
+        if not folder.is_dir():
+            continue
+        for object_path in folder.iterdir():
+            object_stat = object_path.stat()
+            saved_bytes += object_stat.st_size * max(object_stat.st_nlink - 2, 0)
+    return saved_bytes
+
+def format_size(size):
+    if size < 1024:
+        return f'{size} B'
+    for unit in ['KB', 'MB', 'GB']:
+        size /= 1024
+        if size < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}'